@@ -0,0 +1,155 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Import cost of a cold start, for the most requested routes.
+
+Each route is measured in a fresh interpreter, which imports main.py (as
+App Engine does on a cold start) and then the handler the route resolves
+to. Every module imported on the way is timed. The report lists the total
+and the modules that cost the most, counting only the time spent in the
+module itself, not in the modules it imports.
+
+"Eager" imports handlers.site and handlers.api up front, like main.py did
+before routes were resolved lazily.
+
+Usage: python benchmarks/import_cost.py SDK_PATH [runs] [top]
+
+SDK_PATH is the App Engine SDK directory, e.g. /usr/local/google_appengine
+"""
+
+import __builtin__
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ROUTES = [
+    "/api/v1/services",
+    "/api/v1/services/example/events",
+    "/api/v1/statuses",
+    "/api/v1/status-images",
+    "/",
+    "/services/example",
+    "eager",
+]
+
+def sdk_paths(sdk):
+    return [sdk, os.path.join(sdk, "lib", "webob"), 
+        os.path.join(sdk, "lib", "yaml", "lib"),
+        os.path.join(sdk, "lib", "django_1_1")]
+
+def measure(route):
+    """
+    Runs in the child interpreter: imports what a cold start serving the
+    given route imports, and prints "module self_ms" lines
+    """
+    timings = {}
+    stack = []
+    real_import = __builtin__.__import__
+    
+    def timed_import(name, *args, **kwargs):
+        if name in sys.modules:
+            return real_import(name, *args, **kwargs)
+        stack.append(0.0)
+        began = time.time()
+        try:
+            return real_import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - began
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            timings[name] = timings.get(name, 0.0) + elapsed - children
+            
+    __builtin__.__import__ = timed_import
+    began = time.time()
+    
+    import main
+    if route == "eager":
+        from handlers import site, api
+    else:
+        for regexp, handler in main.application._url_mapping:
+            if regexp.match(route):
+                getattr(handler, "resolve", lambda: handler)()
+                break
+                
+    total = time.time() - began
+    __builtin__.__import__ = real_import
+    
+    print "total %f" % (total * 1000)
+    for name, elapsed in timings.items():
+        print "%s %f" % (name, elapsed * 1000)
+        
+def run(sdk, route):
+    """Returns the total and the per module times of one cold start"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sdk_paths(sdk))
+    env.setdefault("SERVER_SOFTWARE", "Development/benchmark")
+    env.setdefault("APPLICATION_ID", "stashboard")
+    
+    child = subprocess.Popen([sys.executable, __file__, "--child", route],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE)
+    output = child.communicate()[0]
+    if child.returncode:
+        raise SystemExit("Measuring %s failed" % route)
+        
+    timings = {}
+    for line in output.splitlines():
+        name, elapsed = line.rsplit(" ", 1)
+        timings[name] = float(elapsed)
+    return timings.pop("total"), timings
+    
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        sys.path.insert(0, ROOT)
+        measure(sys.argv[2])
+        return
+        
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__.strip())
+    sdk = sys.argv[1]
+    runs = len(sys.argv) > 2 and int(sys.argv[2]) or 5
+    top = len(sys.argv) > 3 and int(sys.argv[3]) or 8
+    
+    for route in ROUTES:
+        totals = []
+        modules = {}
+        for i in range(runs):
+            total, timings = run(sdk, route)
+            totals.append(total)
+            for name, elapsed in timings.items():
+                modules.setdefault(name, []).append(elapsed)
+                
+        totals.sort()
+        print "%-40s %8.1f ms (median of %d)" % (route, totals[runs // 2], 
+            runs)
+        
+        costs = [(sum(t) / runs, name) for name, t in modules.items()]
+        costs.sort()
+        costs.reverse()
+        for elapsed, name in costs[:top]:
+            print "    %-36s %8.1f ms" % (name, elapsed)
+        print
+
+if __name__ == "__main__":
+    main()
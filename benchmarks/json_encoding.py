@@ -0,0 +1,91 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Compare the old (jsonpickle + cgi.escape) and new (utils.jsonify) JSON
+encoding of a 1,000 event list response.
+
+Usage: python benchmarks/json_encoding.py [events] [runs]
+
+Runs without the App Engine SDK.
+"""
+
+import cgi
+import os
+import sys
+import timeit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "utils/external"))
+
+import jsonpickle
+from utils import jsonify
+
+def event(i):
+    "An event as returned by Event.rest"
+    base_url = "http://status.example.com/api/v1"
+    sid = "ahJpc215d2Vic2VydmljZWRvd25yCwsSBUV2ZW50G%04dM" % i
+    return {
+        "sid": sid,
+        "timestamp": "Mon, 28 Jun 2010 22:17:%02d GMT" % (i % 60),
+        "status": {
+            "name": "Down",
+            "id": "down",
+            "description": "The service is currently down",
+            "level": "ERROR",
+            "url": base_url + "/statuses/down",
+            "image": "http://status.example.com/images/status/cross-circle.png",
+        },
+        "message": "Requests to <api> & <web> are failing (#%d)" % i,
+        "url": base_url + "/services/example/events/" + sid,
+        "informational": i % 7 == 0,
+    }
+
+def old_encode(data):
+    return cgi.escape(jsonpickle.encode(data))
+
+def main():
+    count = 1000
+    runs = 20
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        runs = int(sys.argv[2])
+
+    data = {"events": [event(i) for i in range(count)]}
+
+    old = old_encode(data)
+    new = jsonify.encode(data)
+    if old != new:
+        print "Output differs!"
+        sys.exit(1)
+
+    print "%d events, %d bytes, output identical" % (count, len(new))
+    print "json backend: %s" % jsonify.json.__name__
+
+    for name, func in [("jsonpickle + cgi.escape", old_encode),
+                       ("utils.jsonify", jsonify.encode)]:
+        timer = timeit.Timer(lambda: func(data))
+        best = min(timer.repeat(3, runs)) / runs
+        print "%-25s %8.2f ms" % (name, best * 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Dispatch cost of the routes in main.py, for every URL shape they serve.
+
+Compares trying each route's regexp in turn, as webapp.WSGIApplication
+does, with the Router of utils/routing.py, both without its cache of the
+last paths matched and with it. Paths the two send to different
+handlers are listed; captures spanning several segments are the only 
+expected difference.
+
+Usage: python benchmarks/routing_dispatch.py SDK_PATH [runs]
+
+SDK_PATH is the App Engine SDK directory, e.g. /usr/local/google_appengine
+"""
+
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PATHS = [
+    "/",
+    "/debug",
+    "/_ah/warmup",
+    "/403.html",
+    "/404.html",
+    "/api/v1/services",
+    "/api/v1/events",
+    "/api/v1/sync",
+    "/api/v1/services/example/events",
+    "/api/v1/services/example/events/current",
+    "/api/v1/services/example/events/ahJzdGFzaGJvYXJkcgsLEgVFdmVudBgPDA",
+    "/api/v1/services/example",
+    "/api/v1/statuses",
+    "/api/v1/statuses/down",
+    "/api/v1/status-images",
+    "/api/v1/levels",
+    "/api/v1/dashboard",
+    "/api/v1/cache",
+    "/api/v1/jobs/12",
+    "/api/v1/unknown",
+    "/tasks/delete",
+    "/tasks/migrate",
+    "/tasks/migrate-events",
+    "/services/example",
+    "/services/example/2010",
+    "/services/example/2010/07",
+    "/services/example/2010/07/17",
+    "/documentation/credentials",
+    "/documentation/verify",
+    "/documentation/overview",
+    "/unknown/page",
+]
+
+def linear_router(routes):
+    """Returns a match function scanning the routes like webapp does"""
+    compiled = []
+    for regexp, handler in routes:
+        if not regexp.startswith("^"):
+            regexp = "^" + regexp
+        if not regexp.endswith("$"):
+            regexp += "$"
+        compiled.append((re.compile(regexp), handler))
+        
+    def match(path):
+        for regexp, handler in compiled:
+            m = regexp.match(path)
+            if m:
+                return handler, m.groups()
+        return None, ()
+    return match
+    
+def name(handler):
+    return getattr(handler, "path", getattr(handler, "__name__", handler))
+    
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__.strip())
+    sdk = sys.argv[1]
+    runs = len(sys.argv) > 2 and int(sys.argv[2]) or 20000
+    
+    sys.path[0:0] = [ROOT, os.path.join(ROOT, "utils/external"), sdk, 
+        os.path.join(sdk, "lib", "webob"), 
+        os.path.join(sdk, "lib", "yaml", "lib")]
+    os.environ.setdefault("SERVER_SOFTWARE", "Development/benchmark")
+    os.environ.setdefault("APPLICATION_ID", "stashboard")
+    
+    import main
+    from utils import routing
+    
+    routes = routing.lazy_routes(main.ROUTES)
+    routers = [linear_router(routes), routing.Router(routes, 0).match,
+        routing.Router(routes).match]
+        
+    linear, trie = routers[:2]
+    for path in PATHS:
+        expected, found = linear(path), trie(path)
+        if expected != found:
+            print "%s: linear scan %s%r, trie %s%r" % (path, 
+                name(expected[0]), expected[1], name(found[0]), found[1])
+    print
+    
+    print "%-30s %12s %12s %12s" % ("path", "linear us", "trie us", 
+        "cached us")
+    totals = [0.0, 0.0, 0.0]
+    for path in PATHS:
+        times = []
+        for match in routers:
+            began = time.time()
+            for i in xrange(runs):
+                match(path)
+            times.append((time.time() - began) / runs * 1e6)
+        totals = [t + e for t, e in zip(totals, times)]
+        print "%-30s %12.2f %12.2f %12.2f" % (path[:30], times[0], times[1],
+            times[2])
+        
+    print "%-30s %12.2f %12.2f %12.2f" % ("mean", totals[0] / len(PATHS), 
+        totals[1] / len(PATHS), totals[2] / len(PATHS))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Throughput of server.py, against running main.py as a CGI script.
+
+Each configuration serves PATH for a number of seconds to concurrent 
+clients, after a few warm up requests. Server clients keep their 
+connection alive between requests; the CGI path starts an interpreter per
+request, which imports main.py and serves the request against the API of a
+running server (as App Engine's CGI model does on every cold start).
+
+Usage: python benchmarks/server_throughput.py SDK_PATH [seconds] [clients] 
+    [path]
+
+SDK_PATH is the App Engine SDK directory, e.g. /usr/local/google_appengine
+"""
+
+import httplib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SERVER = os.path.join(ROOT, "server.py")
+PORT = 8089
+WARM_UP = 20
+
+# (name, processes, threads)
+POOLS = [
+    ("thread pool, 1 x 8", 1, 8),
+    ("process pool, 4 x 1", 4, 1),
+    ("mixed pool, 2 x 4", 2, 4),
+]
+
+def start_server(sdk, directory, processes, threads):
+    api = os.path.join(directory, "api.sock")
+    server = subprocess.Popen([sys.executable, SERVER, "--sdk", sdk, 
+        "--port", str(PORT), "--processes", str(processes), 
+        "--threads", str(threads), "--api-socket", api,
+        "--datastore", os.path.join(directory, "datastore")])
+        
+    for i in range(100):
+        try:
+            connection = httplib.HTTPConnection("127.0.0.1", PORT)
+            connection.request("GET", "/api/v1/statuses")
+            if connection.getresponse().status == 200:
+                return server, api
+        except Exception:
+            time.sleep(0.2)
+    stop_server(server)
+    raise SystemExit("The server did not start")
+    
+def stop_server(server):
+    os.kill(server.pid, signal.SIGTERM)
+    server.wait()
+    
+def http_client(path):
+    connection = httplib.HTTPConnection("127.0.0.1", PORT)
+    def request():
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    return request
+    
+def cgi_client(sdk, api, path):
+    env = dict(os.environ)
+    env.update({
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "127.0.0.1",
+        "SERVER_PORT": str(PORT),
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "SERVER_SOFTWARE": "Stashboard Server",
+        "AUTH_DOMAIN": "gmail.com",
+        "USER_EMAIL": "",
+        "USER_IS_ADMIN": "0",
+        "CURRENT_VERSION_ID": "benchmark.1",
+    })
+    argv = [sys.executable, SERVER, "--sdk", sdk, "--cgi", 
+        "--api-socket", api]
+        
+    def request():
+        child = subprocess.Popen(argv, env=env, stdin=open(os.devnull), 
+            stdout=subprocess.PIPE)
+        output = child.communicate()[0]
+        return int(output.split(None, 2)[1])
+    return request
+    
+def measure(make_client, seconds, clients):
+    """Returns the requests per second and the mean latency in ms"""
+    warm = make_client()
+    for i in range(WARM_UP):
+        warm()
+        
+    latencies = []
+    errors = []
+    deadline = time.time() + seconds
+    
+    def run():
+        request = make_client()
+        while time.time() < deadline:
+            began = time.time()
+            status = request()
+            if status != 200:
+                errors.append(status)
+            latencies.append(time.time() - began)
+            
+    threads = [threading.Thread(target=run) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+        
+    if errors:
+        print "    %d requests failed (e.g. %s)" % (len(errors), errors[0])
+    return len(latencies) / float(seconds), \
+        sum(latencies) * 1000 / max(len(latencies), 1)
+        
+def report(name, result):
+    print "%-24s %8.1f req/s %8.1f ms" % ((name,) + result)
+    
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__.strip())
+    sdk = sys.argv[1]
+    seconds = len(sys.argv) > 2 and int(sys.argv[2]) or 10
+    clients = len(sys.argv) > 3 and int(sys.argv[3]) or 8
+    path = len(sys.argv) > 4 and sys.argv[4] or "/api/v1/statuses"
+    
+    print "%s, %d clients, %d seconds" % (path, clients, seconds)
+    for name, processes, threads in POOLS:
+        directory = tempfile.mkdtemp()
+        server, api = start_server(sdk, directory, processes, threads)
+        try:
+            report(name, measure(lambda: http_client(path), seconds, clients))
+            if name == POOLS[0][0]:
+                report("cgi", measure(lambda: cgi_client(sdk, api, path), 
+                    seconds, clients))
+        finally:
+            stop_server(server)
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Compare the per-render cost of the basic front page and service page
+templates, before and after compiled templates were cached with their
+{% extends %} resolved.
+
+"Parsed per render" re-reads and re-parses every file each time, like the
+debug mode of webapp.template. "Parents parsed per render" caches the
+compiled template but leaves {% extends %} to Django, which re-reads and
+re-parses base.html on every render; that is what webapp.template did in
+production.
+
+Usage: python benchmarks/template_render.py [services] [runs]
+
+Needs Django 1.1 on the path, e.g. PYTHONPATH=$SDK/lib/django_1_1
+"""
+
+import datetime
+import os
+import sys
+import timeit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "utils/external"))
+
+from utils import template
+import django.template.loader
+
+BASIC = os.path.join(ROOT, "views/default/basic")
+
+class Status(object):
+    def __init__(self, name, image):
+        self.name = name
+        self.image = image
+        self.description = "The service is " + name.lower()
+
+class Service(object):
+    def __init__(self, i, status):
+        self.slug = "service-%d" % i
+        self.name = "Service %d" % i
+        self.description = "An example service"
+        self.current_status = status
+        today = datetime.date.today()
+        self.last_five_days = [{
+            "day": today - datetime.timedelta(days=d),
+            "image": status.image,
+        } for d in range(1, 6)]
+
+class Event(object):
+    def __init__(self, i, status):
+        self.start = datetime.datetime(2010, 6, 28, 22, i % 60)
+        self.status = status
+        self.message = "Requests to <api> & <web> are failing (#%d)" % i
+
+def contexts(count):
+    statuses = [Status("Up", "tick-circle"), Status("Down", "cross-circle"),
+        Status("Warning", "exclamation")]
+    services = [Service(i, statuses[i % 3]) for i in range(count)]
+    common = {
+        "title": "Stashboard",
+        "user": None,
+        "login_link": "/_ah/login?continue=/",
+    }
+    
+    index = dict(common)
+    index.update({
+        "services": services,
+        "statuses": statuses,
+        "past": [d["day"] for d in services[0].last_five_days],
+        "default": statuses[0],
+    })
+    
+    service = dict(common)
+    service.update({
+        "service": services[0],
+        "events": [Event(i, statuses[i % 3]) for i in range(100)],
+        "start_date": None,
+    })
+    
+    return [("index.html", index), ("service.html", service)]
+
+old_cache = {}
+
+def render_parents_parsed(path, data):
+    "Render like webapp.template did in production"
+    directory, name = os.path.split(path)
+    old = template._swap_settings({"TEMPLATE_DIRS": [directory]})
+    try:
+        t = old_cache.get(path)
+        if t is None:
+            t = old_cache[path] = django.template.loader.get_template(name)
+        return t.render(template.Context(data))
+    finally:
+        template._swap_settings(old)
+
+def render_all_parsed(path, data):
+    "Render like webapp.template did in debug mode"
+    old_cache.clear()
+    return render_parents_parsed(path, data)
+
+def render_cached(path, data):
+    return template.render(path, data)
+
+def render_cached_unchecked(path, data):
+    return template.render(path, data, check_mtime=False)
+
+def main():
+    count = 20
+    runs = 200
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        runs = int(sys.argv[2])
+        
+    renderers = [
+        ("Parsed per render", render_all_parsed),
+        ("Parents parsed per render", render_parents_parsed),
+        ("Cached, mtime checked", render_cached),
+        ("Cached, mtime unchecked", render_cached_unchecked),
+    ]
+    
+    for name, data in contexts(count):
+        path = os.path.join(BASIC, name)
+        
+        expected = render_all_parsed(path, data)
+        for label, func in renderers:
+            if func(path, data) != expected:
+                print "%s: %s output differs!" % (name, label)
+                sys.exit(1)
+                
+        print "basic/%s, %d services, %d bytes, output identical" % (name,
+            count, len(expected))
+            
+        for label, func in renderers:
+            timer = timeit.Timer(lambda: func(path, data))
+            best = min(timer.repeat(3, runs)) / runs
+            print "  %-27s %8.3f ms" % (label, best * 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Stress test for concurrent template rendering.
+
+Several threads render the rich and the basic front pages and service
+pages at the same time. Both trees have their own base.html and
+_legend.html, so a template resolved from the wrong directory shows up as
+a wrong page. Every render is compared with the page rendered by a single
+thread beforehand. Half of the threads compile their templates on every
+render (as debug mode does), so compiling runs concurrently too.
+
+Usage: python benchmarks/template_threads.py [threads] [renders]
+
+Needs Django 1.1 on the path, e.g. PYTHONPATH=$SDK/lib/django_1_1
+"""
+
+import datetime
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "utils/external"))
+
+from utils import template
+
+VIEWS = os.path.join(ROOT, "views/default")
+
+class Status(object):
+    def __init__(self, name, image):
+        self.name = name
+        self.image = image
+        self.description = "The service is " + name.lower()
+
+class Service(object):
+    def __init__(self, i, status):
+        self.slug = "service-%d" % i
+        self.name = "Service %d" % i
+        self.description = "An example service"
+        self.current_status = status
+        self.last_five_days = [{
+            "day": datetime.date(2010, 6, 28 - d),
+            "image": status.image,
+        } for d in range(1, 6)]
+
+class Event(object):
+    def __init__(self, i, status):
+        self.start = datetime.datetime(2010, 6, 28, 22, i % 60)
+        self.status = status
+        self.message = "Event #%d" % i
+
+def pages():
+    "Returns a list of (template path, template values)"
+    statuses = [Status("Up", "tick-circle"), Status("Down", "cross-circle")]
+    services = [Service(i, statuses[i % 2]) for i in range(10)]
+    data = {
+        "title": "Stashboard",
+        "user": None,
+        "user_is_admin": False,
+        "login_link": "/_ah/login?continue=/",
+        "services": services,
+        "statuses": statuses,
+        "past": [d["day"] for d in services[0].last_five_days],
+        "default": statuses[0],
+        "service": services[0],
+        "events": [Event(i, statuses[i % 2]) for i in range(20)],
+    }
+    
+    return [(os.path.join(VIEWS, name), data) for name in [
+        "index.html", "service.html", 
+        "basic/index.html", "basic/service.html",
+    ]]
+
+def main():
+    threads = 16
+    renders = 200
+    if len(sys.argv) > 1:
+        threads = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        renders = int(sys.argv[2])
+        
+    work = pages()
+    expected = dict([(path, template.render(path, data)) 
+        for path, data in work])
+    # Start from empty caches so the first renders compile concurrently
+    template._loaders.clear()
+    
+    errors = []
+    start = threading.Event()
+    
+    def run(n):
+        debug = n % 2 == 1
+        start.wait()
+        for i in range(renders):
+            path, data = work[(n + i) % len(work)]
+            try:
+                page = template.render(path, data, debug=debug)
+            except Exception, e:
+                errors.append("%s: %r" % (path, e))
+                continue
+            if page != expected[path]:
+                errors.append("%s: wrong output" % path)
+                
+    workers = [threading.Thread(target=run, args=(n,)) 
+        for n in range(threads)]
+    for worker in workers:
+        worker.start()
+        
+    began = time.time()
+    start.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - began
+    
+    total = threads * renders
+    print "%d threads, %d renders in %.2f s, %d failures" % (threads, total,
+        elapsed, len(errors))
+    for error in errors[:10]:
+        print "  " + error
+        
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
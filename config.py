@@ -21,9 +21,6 @@
 import os
 import logging
 
-from google.appengine.dist import use_library
-use_library('django', '1.1')
-
 APP_ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
 
 #Stashboard version
@@ -34,6 +31,10 @@ VERSION = "1.1.6"
 DEBUG = os.environ['SERVER_SOFTWARE'].startswith('Dev')
 logging.info("Starting application in DEBUG mode: %s", DEBUG)
 
+# Reload templates whose files changed. Deployed files never change, so
+# production skips the check
+TEMPLATE_CHECK_MTIME = DEBUG
+
 SITE = {
     "html_type": "text/html",
     "charset": "utf-8",
@@ -33,15 +33,12 @@ from datetime import timedelta
 from datetime import date
 from datetime import datetime
 from datetime import time
-from dateutil.parser import parse
 import string
 import re
 import os
 import cgi
 import urllib
 import logging
-import jsonpickle
-import status_images
 
 from wsgiref.handlers import format_date_time
 from time import mktime
@@ -51,11 +48,37 @@ from google.appengine.api import users
 from google.appengine.ext import db
 
 from handlers import restful
+from handlers import tasks
 from utils import authorized
 from utils import slugify
-from models import Status, Event, Service, Level
+from utils import versions
+from utils import jsonify
+from models import Status, Event, Service, ServiceDay, Level, DeleteJob
+from models import status_registry, request_cache, prefetch_references
+from models import BATCH_SIZE
 import config
 
+# Default and largest number of events returned by one events list request
+EVENTS_PAGE_SIZE = 100
+MAX_EVENTS_PAGE_SIZE = 1000
+# Events are fetched and written out this many at a time
+EVENTS_BATCH_SIZE = 100
+
+# Largest number of events posted in one bulk events request
+MAX_BULK_EVENTS = 500
+
+# Largest number of services and statuses in one sync request
+MAX_SYNC_DEFINITIONS = 1000
+
+# The encoded list of every status image, by host, since image URLs are 
+# absolute. Emptied when it grows past MAX_CACHED_IMAGE_LISTS
+IMAGE_LISTS = {}
+MAX_CACHED_IMAGE_LISTS = 20
+
+# Number of past days summarized by the dashboard resource
+DASHBOARD_DAYS = 5
+MAX_DASHBOARD_DAYS = 31
+
 def aware_to_naive(d):
     """Convert an aware date to an naive date, in UTC"""
     offset = d.utcoffset()
@@ -70,20 +93,19 @@ class NotFoundHandler(restful.Controller):
         self.error(404, "Can't find resouce")
 
 class ServicesListHandler(restful.Controller):
+    def validators(self, version):
+        if self.valid_version(version):
+            return [versions.GLOBAL, versions.STATUSES]
+        
+    @restful.cached
     def get(self, version):
         logging.debug("ServicesListHandler#get")
         if (self.valid_version(version)):
             
             query = Service.all().order('name')
-            data = []
-
-
-            for s in query:
-                data.append(s.rest(self.base_url(version)))
+            base_url = self.base_url(version)
 
-            data = { "services": data }
-
-            self.json(data)
+            self.json_stream("services", (s.rest(base_url) for s in query))
             
         else:
             self.error(404, "API Version %s not supported" % version)
@@ -100,16 +122,21 @@ class ServicesListHandler(restful.Controller):
             if name and description:
                 slug = slugify.slugify(name)
                 existing_s = Service.get_by_slug(slug)
+                if existing_s:
+                    existing_s = Service.update(existing_s.key(), 
+                        description=description)
 
                 # Update existing resource
                 if existing_s:
-                    existing_s.description = description
-                    existing_s.put()
+                    versions.bump(versions.GLOBAL, versions.service(slug))
                     self.json(existing_s.rest(self.base_url(version)))
                 # Create new service
+                elif DeleteJob.pending(Service.key_for(slug)):
+                    self.error(409, "Service %s is still being deleted" % slug)
                 else:
-                    s = Service(name=name, slug=slug, description=description)
+                    s = Service.create(slug, name, description)
                     s.put()
+                    versions.bump(versions.GLOBAL, versions.service(slug))
                     self.json(s.rest(self.base_url(version)))
             else:
                 self.error(400, "Bad Data: Name: %s, Description: %s" % (name, description))
@@ -118,6 +145,11 @@ class ServicesListHandler(restful.Controller):
 
             
 class ServiceInstanceHandler(restful.Controller):
+    def validators(self, version, service_slug):
+        if self.valid_version(version):
+            return [versions.service(service_slug), versions.STATUSES]
+        
+    @restful.cached
     def get(self, version, service_slug):
         logging.debug("ServiceInstanceHandler#get")
         
@@ -140,15 +172,20 @@ class ServiceInstanceHandler(restful.Controller):
         
         if (self.valid_version(version)):
             service = Service.get_by_slug(service_slug)
-            if service:
+            if service and (name or description):
+                values = {}
                 if description:
-                    service.description = description
+                    values["description"] = description
                 
                 if name:
-                    service.name = name
+                    values["name"] = name
                 
+                service = Service.update(service.key(), **values)
+                
+            if service:
                 if name or description:
-                    service.put()
+                    versions.bump(versions.GLOBAL, 
+                        versions.service(service_slug))
                     
                 self.json(service.rest(self.base_url(version)))   
             else:
@@ -165,14 +202,10 @@ class ServiceInstanceHandler(restful.Controller):
             service = Service.get_by_slug(service_slug)
             
             if service:
-                query = Event.all()
-                query.filter('service =', service)
-                if query:
-                    for e in query:
-                        e.delete()
-
-                service.delete()
-                self.json(service.rest(self.base_url(version)))
+                # The service is gone now, its events go in the background
+                job = DeleteJob.start(service)
+                tasks.queue_delete_job(job)
+                self.accepted(job.rest(self.base_url(version)))
             else:
                 self.error(404, "Service %s not found" % service_slug)
         else:
@@ -183,6 +216,11 @@ class ServiceInstanceHandler(restful.Controller):
 
 
 class EventsListHandler(restful.Controller):
+    def validators(self, version, service_slug):
+        if self.valid_version(version):
+            return [versions.service(service_slug), versions.STATUSES]
+        
+    @restful.cached
     def get(self, version, service_slug):
         logging.debug("StatusesListHandler#get")
         
@@ -193,8 +231,11 @@ class EventsListHandler(restful.Controller):
                 start = self.request.get('start', default_value=None)
                 end = self.request.get('end', default_value=None)
                                  
-                query = Event.all()
-                query.filter('service =', service)
+                query = service.event_query()
+                
+                if start or end:
+                    # dateutil is slow to import, see benchmarks/import_cost.py
+                    from dateutil.parser import parse
                         
                 if start:
                     try:
@@ -213,16 +254,62 @@ class EventsListHandler(restful.Controller):
                         return
                         
                 query.order('-start')
+                
+                try:
+                    limit = int(self.request.get('limit', 
+                        default_value=EVENTS_PAGE_SIZE))
+                except ValueError:
+                    self.error(400, "Invalid limit")
+                    return
+                    
+                limit = max(1, min(limit, MAX_EVENTS_PAGE_SIZE))
+                cursor = self.request.get('cursor', default_value=None)
                         
                 if query:
-                    data = []
-
-                    for s in query:
-                        data.append(s.rest(self.base_url(version)))
-
-                    data = { "events": data }
+                    base_url = self.base_url(version)
+                    page = {"count": 0, "cursor": None, "done": False}
+                    
+                    def fetch_batch():
+                        size = min(limit - page["count"], EVENTS_BATCH_SIZE)
+                        batch = query.fetch(size)
+                        page["count"] += len(batch)
+                        page["done"] = len(batch) < size or page["count"] >= limit
+                        page["cursor"] = query.cursor()
+                        query.with_cursor(page["cursor"])
+                        return prefetch_references(batch, 
+                            [Event.status, Event.service], known=[service])
+                    
+                    # Fetch the first batch up front, so a bad cursor is 
+                    # reported before anything is written
+                    try:
+                        if cursor:
+                            query.with_cursor(cursor)
+                        batch = fetch_batch()
+                    except (db.BadRequestError, db.BadValueError):
+                        self.error(400, "Invalid cursor: %s" % cursor)
+                        return
+                        
+                    def events(batch):
+                        while batch:
+                            for e in batch:
+                                yield e.rest(base_url)
+                            if page["done"]:
+                                break
+                            batch = fetch_batch()
+                    
+                    def next_page():
+                        # A full page means there may be more events
+                        if page["count"] < limit:
+                            return {}
+                        params = [("limit", limit), ("cursor", page["cursor"])]
+                        if start:
+                            params.append(("start", start))
+                        if end:
+                            params.append(("end", end))
+                        return {"next": base_url + service.resource_url() + 
+                            "/events?" + urllib.urlencode(params)}
 
-                    self.json(data) 
+                    self.json_stream("events", events(batch), next_page)
                 else:
                     self.error(404, "No events for Service %s" % service_slug)
             else:
@@ -245,22 +332,29 @@ class EventsListHandler(restful.Controller):
                 if service:
                     
                     if not status_slug:
-                        event = service.current_event()
-                        if event:
-                            status = event.status
-                        else:
-                            status = Status.default()
+                        status = status_registry.get(
+                            Service.current_status.get_value_for_datastore(service))
+                        status = status or Status.default()
                     else:
                         status = Status.get_by_slug(status_slug)
 
-                    if status:
-                        e = Event(status=status, service=service,
-                                message=message)
+                    if status and DeleteJob.pending(status.key()):
+                        # The job would leave the event without its status
+                        self.error(409, "Status %s is still being deleted" %
+                            status.slug)
+                    elif status:
+                        e = Event(parent=service, status=status, 
+                                service=service, message=message)
 
                         e.informational = informational and informational == "true"
 
-                        e.put()
-                        self.json(e.rest(self.base_url(version)))
+                        if Service.event_added(e):
+                            versions.bump(versions.GLOBAL, 
+                                versions.service(service_slug))
+                            self.json(e.rest(self.base_url(version)))
+                        else:
+                            self.error(404, "Service %s not found" % 
+                                service_slug)
                     else:
                         self.error(404, "Status %s not found" % status_slug)
                 else:
@@ -272,7 +366,146 @@ class EventsListHandler(restful.Controller):
         
 
         
+class BulkEventsHandler(restful.Controller):
+    """
+    Adds events to any number of services in one request. Takes a JSON 
+    list of {"service", "status", "message", "informational"} records, as
+    the request body or in the "events" parameter, and returns one result
+    per record, in the same order: the new event, or an error.
+    """
+    
+    def record_error(self, code, message):
+        return {"error": True, "code": code, "message": message}
+        
+    @authorized.api("admin")
+    def post(self, version):
+        logging.debug("BulkEventsHandler#post")
+        
+        if (self.valid_version(version)):
+            data = self.request.get("events", default_value=None)
+            if data is None:
+                data = self.request.body
+                
+            try:
+                records = jsonify.decode(data)
+            except ValueError:
+                self.error(400, "Events must be a JSON list")
+                return
+                
+            if not isinstance(records, list):
+                self.error(400, "Events must be a JSON list")
+                return
+                
+            if len(records) > MAX_BULK_EVENTS:
+                self.error(400, "At most %d events can be posted at once" % 
+                    MAX_BULK_EVENTS)
+                return
+                
+            slugs = set()
+            for record in records:
+                if isinstance(record, dict) and \
+                    isinstance(record.get("service"), basestring):
+                    slugs.add(record["service"])
+                    
+            services = {}
+            for service in Service.get_by_slugs(list(slugs)):
+                if service:
+                    services[service.slug] = service
+                
+            base_url = self.base_url(version)
+            results = []
+            events = []
+            # Whether each status used is being deleted, by key
+            deleting = {}
+            
+            for record in records:
+                if not isinstance(record, dict):
+                    results.append(self.record_error(400, "Bad Data"))
+                    continue
+                    
+                service_slug = record.get("service")
+                status_slug = record.get("status")
+                message = record.get("message")
+                informational = record.get("informational")
+                
+                if not message:
+                    results.append(self.record_error(400, 
+                        "Event message is required"))
+                    continue
+                    
+                # Any JSON value may come in, and lists can't be looked up
+                if not isinstance(service_slug, basestring) or \
+                    (status_slug and not isinstance(status_slug, basestring)):
+                    results.append(self.record_error(400, 
+                        "Service and status must be slugs"))
+                    continue
+                    
+                service = services.get(service_slug)
+                
+                if not service:
+                    results.append(self.record_error(404, 
+                        "Service %s not found" % service_slug))
+                else:
+                    if not status_slug:
+                        status = status_registry.get(
+                            Service.current_status.get_value_for_datastore(service))
+                        status = status or Status.default()
+                    else:
+                        status = Status.get_by_slug(status_slug)
+                        
+                    if status and status.key() not in deleting:
+                        deleting[status.key()] = DeleteJob.pending(status.key())
+                        
+                    if status and deleting[status.key()]:
+                        results.append(self.record_error(409, 
+                            "Status %s is still being deleted" % status.slug))
+                    elif status:
+                        e = Event(parent=service, status=status, 
+                            service=service, message=unicode(message))
+                        e.informational = informational in (True, "true")
+                        events.append(e)
+                        results.append(e)
+                    else:
+                        results.append(self.record_error(404, 
+                            "Status %s not found" % status_slug))
+                        
+            by_service = {}
+            for e in events:
+                key = Event.service.get_value_for_datastore(e)
+                by_service.setdefault(key, []).append(e)
+                
+            # Each service's events are written in a transaction on it
+            names = [versions.GLOBAL]
+            deleted = set()
+            for key, service_events in by_service.items():
+                service = Service.events_added(service_events)
+                if service:
+                    names.append(versions.service(service.slug))
+                else:
+                    deleted.add(key)
+            if len(names) > 1:
+                versions.bump(*names)
+                
+            for i, result in enumerate(results):
+                if not isinstance(result, Event):
+                    continue
+                key = Event.service.get_value_for_datastore(result)
+                if key in deleted:
+                    results[i] = self.record_error(404, 
+                        "Service %s not found" % result.service.slug)
+                else:
+                    results[i] = result.rest(base_url)
+                    
+            self.json({"events": results})
+        else:
+            self.error(404, "API Version %s not supported" % version)
+        
 class CurrentEventHandler(restful.Controller):
+    def validators(self, version, service_slug):
+        if self.valid_version(version):
+            return [versions.service(service_slug), versions.STATUSES]
+        
+    @restful.cached
     def get(self, version, service_slug):
         logging.debug("CurrentStatusHandler#get")
         
@@ -281,10 +514,10 @@ class CurrentEventHandler(restful.Controller):
             service = Service.get_by_slug(service_slug)
         
             if (service):
-                event = service.current_event()
+                event = service.current_event_rest(self.base_url(version))
         
                 if (event):
-                    self.json(event.rest(self.base_url(version))) 
+                    self.json(event) 
                 else:
                     self.error(404, "No current event for Service %s" % service_slug)
             else:
@@ -293,15 +526,20 @@ class CurrentEventHandler(restful.Controller):
             self.error(404, "Version %s not supported" % version)
     
 class EventInstanceHandler(restful.Controller):
+    def validators(self, version, service_slug, sid):
+        if self.valid_version(version):
+            return [versions.service(service_slug), versions.STATUSES]
+        
+    @restful.cached
     def get(self, version, service_slug, sid):
         logging.debug("EventInstanceHandler#get sid=%s" % sid)
         
         if (self.valid_version(version)):
-            service = Service.get_by_slug(service_slug)
+            service, event = Event.get_for_service(service_slug, sid)
 
             if (service):
-                event = Event.get(db.Key(sid))
-                if (event and service.key() == event.service.key()):
+                if (event):
+                    prefetch_references([event], [Event.service], known=[service])
                     self.json(event.rest(self.base_url(version))) 
                 else:
                     self.error(404, "No event for Service %s with sid = %s" % (service_slug,sid))
@@ -316,12 +554,15 @@ class EventInstanceHandler(restful.Controller):
         logging.debug("EventInstanceHandler#delete sid=%s" % sid)
         
         if (self.valid_version(version)):
-            service = Service.get_by_slug(service_slug)
+            service, event = Event.get_for_service(service_slug, sid)
 
             if (service):
-                event = Event.get(db.Key(sid))
-                if (event and service.key() == event.service.key()):
+                if (event):
+                    prefetch_references([event], [Event.service], known=[service])
                     event.delete()
+                    Service.event_removed(event)
+                    versions.bump(versions.GLOBAL, 
+                        versions.service(service_slug))
                     self.success(event.rest(self.base_url(version)))
                 else:
                     self.error(404, "No event for Service %s with sid = %s" % (service_slug,sid))
@@ -333,11 +574,16 @@ class EventInstanceHandler(restful.Controller):
 
 
 class StatusesListHandler(restful.Controller):
+    def validators(self, version):
+        if self.valid_version(version):
+            return [versions.STATUSES]
+        
+    @restful.cached
     def get(self, version):
         logging.debug("StatusesListHandler#get")
         
         if (self.valid_version(version)):
-            query = Status.all().order('severity')
+            query = status_registry.all()
 
             if (query):
                 data = []
@@ -364,21 +610,27 @@ class StatusesListHandler(restful.Controller):
 
             if name and description and severity and image:
                 slug = slugify.slugify(name)
-                status = Status.get_by_slug(slug)
+                status = Status.get_by_slug(slug, cached=False)
 
                 # Update existing resource
                 if status:
+                    changed = status.severity != severity
                     status.description = description
                     status.severity = severity
                     status.image = image
                     status.name = name
                     status.put()
+                    if changed:
+                        ServiceDay.refresh_severity(status)
+                    versions.bump(versions.GLOBAL)
                     self.json(status.rest(self.base_url(version)))
                 # Create new service
                 else:
-                    status = Status(name=name, slug=slug, description=description, 
-                        severity=severity, image=image)
+                    status = Status(key_name=Status.key_name_for(slug), name=name, 
+                        slug=slug, description=description, severity=severity, 
+                        image=image)
                     status.put()
+                    versions.bump(versions.GLOBAL)
                     self.json(status.rest(self.base_url(version)))
             else:
                 self.error(400, "Bad Data")
@@ -388,6 +640,11 @@ class StatusesListHandler(restful.Controller):
 
 
 class StatusInstanceHandler(restful.Controller):
+    def validators(self, version, status_slug):
+        if self.valid_version(version):
+            return [versions.STATUSES]
+        
+    @restful.cached
     def get(self, version, status_slug):
         logging.debug("CurrentStatusHandler#get")
         
@@ -407,7 +664,7 @@ class StatusInstanceHandler(restful.Controller):
 
         
         if (self.valid_version(version)):
-            status = Status.get_by_slug(status_slug)
+            status = Status.get_by_slug(status_slug, cached=False)
             if status:
                 name = self.request.get('name', default_value=None)
                 image = self.request.get('image', default_value=None)
@@ -424,12 +681,20 @@ class StatusInstanceHandler(restful.Controller):
                 if name:
                     status.name = name
                     
+                changed = severity and status.severity != severity
+                
                 if severity:
                     status.severity = severity
                 
                 if description or name or image or severity:
                     status.put()
                     
+                if changed:
+                    ServiceDay.refresh_severity(status)
+                    
+                if description or name or image or severity:
+                    versions.bump(versions.GLOBAL)
+                    
                 self.json(status.rest(self.base_url(version)))
             else:
                 self.error(404, "Status %s not found" % status_slug)
@@ -442,17 +707,15 @@ class StatusInstanceHandler(restful.Controller):
         
         if (self.valid_version(version)):
 
-            status = Status.get_by_slug(status_slug)            
+            status = Status.get_by_slug(status_slug, cached=False)
 
             if status:
-                # We may want to think more about this
-                events = Event.all().filter('status =', status).fetch(1000)
-                for event in events:
-                    event.delete()
-                status.delete()
-                self.json(status.rest(self.base_url(version)))
+                # The status is deleted once its events are
+                job = DeleteJob.start(status)
+                tasks.queue_delete_job(job)
+                self.accepted(job.rest(self.base_url(version)))
             else:
-                self.error(404, "Status %s not found" % service_slug)
+                self.error(404, "Status %s not found" % status_slug)
         else:
             self.error(404, "API Version %s not supported" % version)
 
@@ -460,21 +723,121 @@ class StatusInstanceHandler(restful.Controller):
 
             
 class ImagesListHandler(restful.Controller):
+    """
+    Lists the status images, optionally only those whose name starts with
+    "prefix" and contains "q", and a page of them given "limit" and 
+    "offset". The complete list is encoded once per host.
+    """
+    
+    def images(self, names, host):
+        import status_images
+        return [{"name": name, "url": "http://" + host + status_images.url(name)}
+            for name in names]
+        
     def get(self, version):
         logging.debug("ImagesListHandler#get")
         host = self.request.headers.get('host', 'nohost')
         
         if (self.valid_version(version)):
+            # status_images is large, see benchmarks/import_cost.py
+            import status_images
+            
+            prefix = self.request.get('prefix')
+            q = self.request.get('q')
+            limit = self.request.get('limit')
+            offset = self.request.get('offset')
+            
+            if not (prefix or q or limit or offset):
+                body = IMAGE_LISTS.get(host)
+                if body is None:
+                    body = jsonify.encode({"images": 
+                        self.images(status_images.names, host)})
+                    if len(IMAGE_LISTS) >= MAX_CACHED_IMAGE_LISTS:
+                        IMAGE_LISTS.clear()
+                    IMAGE_LISTS[host] = body
+                self.write_json(body)
+                return
+                
+            try:
+                offset = max(0, int(offset or 0))
+                if limit:
+                    limit = max(1, int(limit))
+            except ValueError:
+                self.error(400, "Invalid limit or offset")
+                return
+                
+            names = status_images.search(prefix, q)
+            data = {"total": len(names)}
+            if limit:
+                page = names[offset:offset + limit]
+                if offset + limit < len(names):
+                    params = [("limit", limit), ("offset", offset + limit)]
+                    if prefix:
+                        params.append(("prefix", prefix))
+                    if q:
+                        params.append(("q", q))
+                    data["next"] = self.base_url(version) + \
+                        "/status-images?" + urllib.urlencode(params)
+            else:
+                page = names[offset:]
+                
+            data["images"] = self.images(page, host)
+            self.json(data)
+        else:
+            self.error(404, "API Version %s not supported" % version)
+            
+class DashboardHandler(restful.Controller):
+    """
+    Every service with its current event and a per-day summary of the
+    last few days, so the front page can be built from a single request
+    """
+    def validators(self, version):
+        if self.valid_version(version):
+            # The days covered move forward at midnight
+            return [versions.GLOBAL, versions.STATUSES, 
+                versions.day(date.today())]
         
-            query = status_images.images
+    @restful.cached
+    def get(self, version):
+        logging.debug("DashboardHandler#get")
         
-            for img in query:
-                img["url"] = "http://" + host + img["url"]
-
-            if (query):
-                self.json({"images": query}) 
-            else:
-                self.error(404, "No images")
+        if (self.valid_version(version)):
+            try:
+                num = int(self.request.get('days', default_value=DASHBOARD_DAYS))
+            except ValueError:
+                self.error(400, "Invalid number of days")
+                return
+                
+            num = max(1, min(num, MAX_DASHBOARD_DAYS))
+            today = date.today()
+            days = [today - timedelta(days=i) for i in range(1, num + 1)]
+            
+            normal = Level.get_severity(Level.normal)
+            base_url = self.base_url(version)
+            data = []
+            
+            services = list(Service.all().order('name'))
+            rollups = ServiceDay.get_for(services, days)
+            
+            for s in services:
+                m = s.rest(base_url)
+                m["days"] = []
+                
+                for d in days:
+                    rollup = rollups[(s.key(), d)]
+                    m["days"].append({
+                        "day": d.isoformat(),
+                        "level": Level.get_level(max(rollup.severity, normal)),
+                        "informational": bool(rollup.informational),
+                        "events": rollup.events,
+                    })
+                    
+                data.append(m)
+            
+            self.json({
+                "days": [d.isoformat() for d in days],
+                "services": data,
+            })
         else:
             self.error(404, "API Version %s not supported" % version)
             
@@ -490,3 +853,268 @@ class LevelsListHandler(restful.Controller):
             
             self.error(404, "API Version %s not supported" % version)
 
+            
+class CacheStatsHandler(restful.Controller):
+    def get(self, version):
+        logging.debug("CacheStatsHandler#get")
+        
+        if (self.valid_version(version)):
+            
+            self.json(restful.cache_stats())
+            
+        else:
+            
+            self.error(404, "API Version %s not supported" % version)
+            
+class JobInstanceHandler(restful.Controller):
+    def get(self, version, job_id):
+        logging.debug("JobInstanceHandler#get")
+        
+        if (self.valid_version(version)):
+            try:
+                job = DeleteJob.get_by_id(int(job_id))
+            except ValueError:
+                job = None
+                
+            if (job):
+                self.json(job.rest(self.base_url(version)))
+            else:
+                self.error(404, "Job %s not found" % job_id)
+        else:
+            self.error(404, "API Version %s not supported" % version)
+            
+class SyncHandler(restful.Controller):
+    """
+    Creates or updates services and statuses from lists of definitions, 
+    so a whole inventory can be synchronized in one request. Takes a JSON
+    object, as the request body or in the "sync" parameter:
+    
+        {"services": [{"name", "description"}, ...],
+         "statuses": [{"name", "description", "level", "image"}, ...],
+         "absent": "ignore", "report" or "delete"}
+         
+    Definitions are matched to existing entities by the slug of their name.
+    With "absent" set to "report" or "delete", services missing from the
+    definitions are listed, and deleted as by ServiceInstanceHandler.delete.
+    Absent services are only deleted if every service definition was 
+    valid, as a bad definition may be the one of an absent service.
+    """
+    
+    def definition_error(self, code, message):
+        return {"error": True, "code": code, "message": message}
+        
+    def strings(self, *values):
+        """Whether the given values are all non-empty strings"""
+        for value in values:
+            if not value or not isinstance(value, basestring):
+                return False
+        return True
+        
+    def sync_statuses(self, definitions, base_url):
+        """Returns a result for each of the given status definitions"""
+        existing = {}
+        for status in Status.all():
+            existing[status.slug] = status
+            
+        results = []
+        changed = []
+        resorted = []
+        
+        for d in definitions:
+            if not isinstance(d, dict):
+                results.append(self.definition_error(400, "Bad Data"))
+                continue
+                
+            name = d.get("name")
+            description = d.get("description")
+            image = d.get("image")
+            severity = Level.get_severity(d.get("level"))
+            
+            # Any JSON value may come in, and the model takes only strings
+            if not (severity and self.strings(name, description, image)):
+                results.append(self.definition_error(400, 
+                    "Bad Data: Name: %s" % name))
+                continue
+                
+            slug = slugify.slugify(name)
+            status = existing.get(slug)
+            
+            if status is None:
+                status = Status(key_name=Status.key_name_for(slug), name=name, 
+                    slug=slug, description=description, severity=severity, 
+                    image=image)
+                existing[slug] = status
+                result = "created"
+            elif (status.name, status.description, status.severity, 
+                status.image) == (name, description, severity, image):
+                result = "unchanged"
+            else:
+                if status.severity != severity:
+                    resorted.append(status)
+                status.name = name
+                status.description = description
+                status.severity = severity
+                status.image = image
+                result = "updated"
+                
+            if result != "unchanged" and status not in changed:
+                changed.append(status)
+            results.append((status, result))
+            
+        if changed:
+            for i in range(0, len(changed), BATCH_SIZE):
+                db.put(changed[i:i + BATCH_SIZE])
+            # Batched puts skip Status.put
+            status_registry.bump()
+            request_cache.clear()
+            versions.bump(versions.GLOBAL)
+            
+        for status in resorted:
+            ServiceDay.refresh_severity(status)
+            
+        return self.rest_results(results, base_url)
+        
+    def sync_services(self, definitions, base_url):
+        """
+        Returns a result for each of the given service definitions, and the
+        existing services missing from them
+        """
+        existing = {}
+        for service in Service.all():
+            existing[service.slug] = service
+            
+        results = []
+        created = []
+        changed = set()
+        seen = set()
+        
+        for d in definitions:
+            if not isinstance(d, dict):
+                results.append(self.definition_error(400, "Bad Data"))
+                continue
+                
+            name = d.get("name")
+            description = d.get("description")
+            
+            # A bad definition still names a service, which isn't absent
+            if self.strings(name):
+                seen.add(slugify.slugify(name))
+                
+            if not self.strings(name, description):
+                results.append(self.definition_error(400, 
+                    "Bad Data: Name: %s, Description: %s" % (name, description)))
+                continue
+                
+            slug = slugify.slugify(name)
+            service = existing.get(slug)
+            
+            if service is None and \
+                DeleteJob.pending(Service.key_for(slug)):
+                results.append(self.definition_error(409, 
+                    "Service %s is still being deleted" % slug))
+                continue
+            elif service is None:
+                service = Service.create(slug, name, description)
+                created.append(service)
+                result = "created"
+            elif (service.name, service.description) == (name, description):
+                result = "unchanged"
+            elif service in created:
+                service.name = name
+                service.description = description
+                result = "updated"
+            else:
+                # In a transaction, to keep the current event snapshot
+                service = Service.update(service.key(), name=name, 
+                    description=description)
+                if service is None:
+                    results.append(self.definition_error(404, 
+                        "Service %s not found" % slug))
+                    continue
+                result = "updated"
+                
+            existing[slug] = service
+            if result != "unchanged":
+                changed.add(slug)
+            results.append((service, result))
+            
+        for i in range(0, len(created), BATCH_SIZE):
+            db.put(created[i:i + BATCH_SIZE])
+        if changed:
+            versions.bump(versions.GLOBAL, 
+                *[versions.service(slug) for slug in changed])
+                
+        absent = [s for slug, s in sorted(existing.items()) if slug not in seen]
+        return self.rest_results(results, base_url), absent
+        
+    def rest_results(self, results, base_url):
+        rest = []
+        for result in results:
+            if isinstance(result, tuple):
+                entity, outcome = result
+                result = entity.rest(base_url)
+                result["result"] = outcome
+            rest.append(result)
+        return rest
+        
+    @authorized.api("admin")
+    def post(self, version):
+        logging.debug("SyncHandler#post")
+        
+        if (self.valid_version(version)):
+            data = self.request.get("sync", default_value=None)
+            if data is None:
+                data = self.request.body
+                
+            try:
+                sync = jsonify.decode(data)
+            except ValueError:
+                sync = None
+                
+            if not isinstance(sync, dict):
+                self.error(400, "Definitions must be a JSON object")
+                return
+                
+            services = sync.get("services", [])
+            statuses = sync.get("statuses", [])
+            absent = sync.get("absent", "ignore")
+            
+            if not isinstance(services, list) or not isinstance(statuses, list):
+                self.error(400, "Services and statuses must be JSON lists")
+                return
+                
+            if len(services) + len(statuses) > MAX_SYNC_DEFINITIONS:
+                self.error(400, "At most %d definitions can be synchronized"
+                    " at once" % MAX_SYNC_DEFINITIONS)
+                return
+                
+            if absent not in ("ignore", "report", "delete"):
+                self.error(400, "Absent must be ignore, report or delete")
+                return
+                
+            # Don't take a request without services for an empty inventory
+            if absent != "ignore" and "services" not in sync:
+                self.error(400, "Absent services need a list of services")
+                return
+                
+            base_url = self.base_url(version)
+            data = {}
+            data["statuses"] = self.sync_statuses(statuses, base_url)
+            data["services"], missing = self.sync_services(services, base_url)
+            
+            if absent != "ignore":
+                data["absent"] = [str(s.slug) for s in missing]
+                
+            if absent == "delete":
+                jobs = []
+                errors = [r for r in data["services"] if r.get("error")]
+                if not errors:
+                    for service in missing:
+                        job = DeleteJob.start(service)
+                        tasks.queue_delete_job(job)
+                        jobs.append(job.rest(base_url))
+                data["jobs"] = jobs
+                
+            self.json(data)
+        else:
+            self.error(404, "API Version %s not supported" % version)
@@ -37,12 +37,26 @@ with an Allow header containing the list of valid methods.
 __author__ = 'William T. Katz'
 
 from google.appengine.ext import webapp
-from google.appengine.ext.webapp import template
-import jsonpickle
+from google.appengine.api import memcache
+from utils import jsonify
+from utils import versions
+from wsgiref.handlers import format_date_time
+from email.utils import parsedate_tz, mktime_tz
+import cgi
+import hashlib
 import logging
 import os
+import urllib
 import config
-import cgi
+
+# Query parameters clients add only to defeat caches
+IGNORED_PARAMS = ("_", "random")
+
+# Cached responses are kept in memcache under these prefixes
+CACHE_PREFIX = "response:"
+CACHE_STATS_PREFIX = "response_stats:"
+# Responses larger than this are not cached (memcache's limit is 1MB)
+MAX_CACHED_SIZE = 900000
 
 # Some useful module methods
 def send_successful_response(handler, response):
@@ -128,6 +142,77 @@ def methods_via_query_allowed(handler_method):
             handler_method(self, *args, **kwargs)
     return redirect_if_needed
     
+def conditional(handler_method):
+    """
+    A decorator answering conditional GETs before the handler runs.
+
+    To use it, decorate your get method and list the change versions 
+    (see utils/versions.py) the response depends on:
+
+    import restful
+    ...
+    def validators(self, version, service_slug):
+      return [versions.service(service_slug)]
+
+    @restful.conditional
+    def get(self, version, service_slug):
+      pass
+
+    The decorator sends an ETag and a Last-Modified header derived from
+    those versions, and answers a matching If-None-Match or 
+    If-Modified-Since with 304 Not Modified without calling get().
+    """
+    def respond_if_modified(self, *args, **kwargs):
+        if not self.not_modified(*args):
+            handler_method(self, *args, **kwargs)
+    return respond_if_modified
+    
+def cached(handler_method):
+    """
+    A decorator extending conditional() with a response cache.
+
+    Successful responses are kept in memcache, keyed by the normalized
+    request URL and the current change versions named by validators(). A
+    write bumping one of those versions changes the key, so stale 
+    responses are never served and simply expire from memcache.
+
+    Hits and misses are counted, see cache_stats().
+    """
+    def respond_from_cache(self, *args, **kwargs):
+        if self.not_modified(*args):
+            return
+            
+        key = self.representation(*args)
+        if key is None:
+            handler_method(self, *args, **kwargs)
+            return
+            
+        response = memcache.get(CACHE_PREFIX + key)
+        if response is not None:
+            memcache.incr(CACHE_STATS_PREFIX + "hits", initial_value=0)
+            content_type, body = response
+            self.response.headers["Content-Type"] = content_type
+            self.response.out.write(body)
+            return
+            
+        memcache.incr(CACHE_STATS_PREFIX + "misses", initial_value=0)
+        handler_method(self, *args, **kwargs)
+        
+        body = self.response.out.getvalue()
+        content_type = self.response.headers.get("Content-Type")
+        if not self.response.has_error() and len(body) <= MAX_CACHED_SIZE:
+            memcache.set(CACHE_PREFIX + key, (content_type, body))
+    return respond_from_cache
+    
+def cache_stats():
+    "Returns the response cache hit and miss counts"
+    stats = memcache.get_multi(["hits", "misses"], 
+        key_prefix=CACHE_STATS_PREFIX)
+    return {
+        "hits": int(stats.get("hits", 0)),
+        "misses": int(stats.get("misses", 0)),
+    }
+    
 class Controller(webapp.RequestHandler):
     """Responsible for handling all API requests"""
 
@@ -142,6 +227,9 @@ class Controller(webapp.RequestHandler):
     def error(self, code, message=None):
         "Returns the JSON representation of an error message"
         self.response.set_status(code)
+        self.response.clear()
+        del self.response.headers["ETag"]
+        del self.response.headers["Last-Modified"]
         
         error = { "error": True, "code": code}
         if (message):
@@ -149,6 +237,15 @@ class Controller(webapp.RequestHandler):
             
         self.json(error)
         
+    def accepted(self, data):
+        """
+        Returns the JSON representation of work started in the background,
+        whose URL is given in data
+        """
+        self.response.set_status(202)
+        self.response.headers["Location"] = data["url"]
+        self.json(data)
+        
     def success(self, message=None):
         "Returns the JSON representation of a success message"
         self.response.set_status(200)
@@ -164,25 +261,115 @@ class Controller(webapp.RequestHandler):
         self.redirect("/.html")
 
     def head(self, *params):
-        pass
+        "Sends the validators get() would send, without a body"
+        self.not_modified(*params)
+        
+    def validators(self, *params):
+        """
+        Returns the names of the change versions the response to get() 
+        depends on, or None if the response can't be validated
+        """
+        return None
+        
+    def normalized_url(self):
+        """
+        Returns the request URL with its query parameters sorted, and 
+        without the parameters clients only add to defeat caches
+        """
+        params = cgi.parse_qsl(self.request.query_string)
+        params = [p for p in params if p[0] not in IGNORED_PARAMS]
+        params.sort()
+        
+        host = self.request.headers.get('host', 'nohost')
+        url = self.request.scheme + "://" + host + self.request.path
+        if params:
+            url += "?" + urllib.urlencode(params)
+        return url
+        
+    def current_versions(self, *params):
+        """
+        Returns the current values of the versions named by validators(),
+        in the same order, or None if the response can't be validated
+        """
+        if not hasattr(self, "_current_versions"):
+            names = self.validators(*params)
+            if names:
+                current = versions.get_multi(names)
+                self._current_versions = [current[name] for name in names]
+            else:
+                self._current_versions = None
+        return self._current_versions
+        
+    def representation(self, *params):
+        """
+        Returns a digest identifying the response get() would send, or None
+        if the response can't be validated
+        """
+        stamps = self.current_versions(*params)
+        if stamps is None:
+            return None
+            
+        # The application version is part of the digest, since a new 
+        # deployment may render the same data differently
+        tag = repr((os.environ.get("CURRENT_VERSION_ID"), 
+            self.normalized_url(), self.validators(*params), stamps))
+        return hashlib.md5(tag).hexdigest()
+        
+    def not_modified(self, *params):
+        """
+        Sets the ETag and Last-Modified headers from the versions named by
+        validators(). Returns True, after setting the 304 status, if the 
+        request's conditional headers show the client is up to date.
+        """
+        stamps = self.current_versions(*params)
+        if stamps is None:
+            return False
+            
+        etag = '"%s"' % self.representation(*params)
+        modified = max(stamps) // 1000000
+        
+        self.response.headers["ETag"] = etag
+        self.response.headers["Last-Modified"] = format_date_time(modified)
+        
+        if_none_match = self.request.headers.get("If-None-Match")
+        if_modified_since = self.request.headers.get("If-Modified-Since")
+        
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            fresh = "*" in tags or etag in tags or "W/" + etag in tags
+        elif if_modified_since:
+            since = parsedate_tz(if_modified_since)
+            fresh = since is not None and modified <= mktime_tz(since)
+        else:
+            fresh = False
+            
+        if fresh:
+            self.response.set_status(304)
+            
+        return fresh
         
     def render(self, templateparams, *args):
         "Writes templateparams to a given template"
+        # Loads Django, which requests that don't render a page never need
+        from utils import template
         path = config.SITE["template_path"]
 
         for p in args:
             path = os.path.join(path, p)
             
-        self.response.out.write(template.render(path, templateparams))
+        self.response.out.write(template.render(path, templateparams, 
+            check_mtime=config.TEMPLATE_CHECK_MTIME))
         
     def json(self, data):
         """
         Renders the given data as json. 
         If callback is valid, renders data as jsonp
         """
-        callback = self.request.get('callback', default_value=None)
+        self.write_json(jsonify.encode(data))
         
-        data = cgi.escape(jsonpickle.encode(data))
+    def write_json(self, data):
+        """Writes already encoded json, or jsonp like json() does"""
+        callback = self.request.get('callback', default_value=None)
         
         if callback:
             self.response.headers.add_header("Content-Type", "application/javascript")
@@ -192,6 +379,56 @@ class Controller(webapp.RequestHandler):
         
         self.response.out.write(data)
         
+    def json_stream(self, name, items, extra=None):
+        """
+        Renders {name: [items], ...} as json, like json() does, but writes
+        each item as soon as it is produced instead of building the whole
+        list and its encoding in memory first.
+        
+        items is an iterable of JSON-ready objects, typically a generator
+        calling rest() on query batches. extra is an optional function 
+        called after the last item, returning a dict of properties to add 
+        after the list.
+        
+        If producing an item fails, everything written so far is discarded
+        and the exception is raised again, so the error is reported just
+        as it would have been by json().
+        """
+        callback = self.request.get('callback', default_value=None)
+        out = self.response.out
+        
+        if callback:
+            self.response.headers.add_header("Content-Type", "application/javascript")
+            out.write(callback + "(")
+        else:
+            self.response.headers.add_header("Content-Type", "application/json")
+            
+        try:
+            out.write("{" + jsonify.encode(name) + ": [")
+            
+            first = True
+            for item in items:
+                if not first:
+                    out.write(", ")
+                out.write(jsonify.encode(item))
+                first = False
+                
+            out.write("]")
+            
+            if extra:
+                for key, value in extra().items():
+                    out.write(", " + jsonify.encode(key) + ": " + 
+                        jsonify.encode(value))
+                        
+            out.write("}")
+        except:
+            self.response.clear()
+            del self.response.headers["Content-Type"]
+            raise
+            
+        if callback:
+            out.write(");")
+        
     def text(self, data):
         "Renders the given data as text/plain"
         self.response.headers.add_header("Content-Type", "text/plain")
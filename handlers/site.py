@@ -54,14 +54,66 @@ from time import mktime
 from google.appengine.ext import webapp
 from google.appengine.ext import db
 from google.appengine.api import users
+from google.appengine.api import memcache
 
-import oauth2 as oauth
 from handlers import restful
 from utils import authorized
+from utils import versions
 from models import Status, Service, Event, Profile, AuthRequest
+from models import status_registry, prefetch_references
 
 import config
 
+# Rendered pages are kept in memcache under this prefix, and in this
+# instance's PAGE_CACHE, which is emptied when it grows past MAX_CACHED_PAGES
+PAGE_CACHE_PREFIX = "page:"
+PAGE_CACHE = {}
+MAX_CACHED_PAGES = 200
+
+def login_bucket():
+    "Returns the kind of visitor pages are rendered for"
+    if not users.get_current_user():
+        return "anonymous"
+    elif users.is_current_user_admin():
+        return "admin"
+    else:
+        return "user"
+        
+def cached_page(handler_method):
+    """
+    A decorator caching the HTML written by a get method, per URL and 
+    login bucket, in this instance and in memcache.
+
+    Like restful.cached, entries are keyed by the current change versions
+    named by the handler's validators(), so any write bumping one of them 
+    stops the entry from being used.
+    """
+    def respond_from_cache(self, *args):
+        representation = self.representation(*args)
+        if representation is None:
+            handler_method(self, *args)
+            return
+            
+        key = PAGE_CACHE_PREFIX + representation + ":" + login_bucket()
+        
+        page = PAGE_CACHE.get(key)
+        if page is None:
+            page = memcache.get(key)
+            
+        if page is not None:
+            self.response.out.write(page)
+        else:
+            handler_method(self, *args)
+            if self.response.has_error():
+                return
+            page = self.response.out.getvalue()
+            memcache.set(key, page)
+            
+        if len(PAGE_CACHE) >= MAX_CACHED_PAGES:
+            PAGE_CACHE.clear()
+        PAGE_CACHE[key] = page
+    return respond_from_cache
+
 def default_template_data():
     user = users.get_current_user()
     
@@ -203,22 +255,25 @@ class DebugHandler(restful.Controller):
 
         
 class BasicRootHandler(restful.Controller):
+    def validators(self):
+        # The past days shown move forward at midnight
+        return [versions.GLOBAL, versions.STATUSES, 
+            versions.day(date.today())]
+            
+    @cached_page
     def get(self):
         user = users.get_current_user()
         logging.debug("BasicRootHandler#get")
 
         q = Service.all()
         q.order("name")
-        services = q.fetch(100)
-        
-        p = Status.all()
-        p.order("severity")
         
         past = get_past_days(5)
         
         td = default_template_data()
-        td["services"] = q.fetch(100)
-        td["statuses"] = p.fetch(100)
+        td["services"] = prefetch_references(q.fetch(100), 
+            [Service.current_status])
+        td["statuses"] = status_registry.all()
         td["past"] = past
         td["default"] = Status.default()
 
@@ -226,6 +281,10 @@ class BasicRootHandler(restful.Controller):
 
 class BasicServiceHandler(restful.Controller):
 
+    def validators(self, service_slug, *args):
+        return [versions.service(service_slug), versions.STATUSES]
+        
+    @cached_page
     def get(self, service_slug, year=None, month=None, day=None):
         user = users.get_current_user()
         logging.debug("BasicServiceHandler#get")
@@ -237,7 +296,7 @@ class BasicServiceHandler(restful.Controller):
             self.render({}, "404.html")
             return
 
-        events = service.events
+        events = service.event_query()
         show_admin = False
 
         try: 
@@ -266,7 +325,8 @@ class BasicServiceHandler(restful.Controller):
 
         td = default_template_data()
         td["service"] = service
-        td["events"] = events.fetch(100)
+        td["events"] = prefetch_references(events.fetch(100), 
+            [Event.status, Event.service], known=[service])
         td["start_date"] = start_date
         td["end_date"] = end_date
 
@@ -309,6 +369,8 @@ class VerifyAccessHandler(restful.Controller):
             consumer_key = 'anonymous'
             consumer_secret = 'anonymous'
 
+            # oauth2 and httplib2 are slow to import, see benchmarks/import_cost.py
+            import oauth2 as oauth
             consumer = oauth.Consumer(consumer_key, consumer_secret)
             
             token = oauth.Token(oauth_token, authr.request_secret)
@@ -369,6 +431,7 @@ class ProfileHandler(restful.Controller):
                 request_token_url = 'https://%s/_ah/OAuthGetRequestToken?oauth_callback=%s' % (host, callback)
                 authorize_url = 'https://%s/_ah/OAuthAuthorizeToken' % host
 
+                import oauth2 as oauth
                 consumer = oauth.Consumer(consumer_key, consumer_secret)
                 client = oauth.Client(consumer)
 
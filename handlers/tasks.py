@@ -0,0 +1,211 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Task queue handlers
+
+Tasks are POSTed by the task queue, which only app admins can do; see
+the /tasks/ handler in app.yaml.
+"""
+
+import logging
+import time
+
+from google.appengine.ext import webapp
+
+try:
+    from google.appengine.api import taskqueue
+except ImportError:
+    from google.appengine.api.labs import taskqueue
+
+from models import DeleteJob, SlugKeyMigration, EventParentMigration, Setting
+from models import ServiceBackfill
+
+# Seconds a delete task works before handing over to the next one, well
+# within the task request deadline
+DELETE_TASK_SECONDS = 20
+
+# Same for the tasks of the migrations
+MIGRATION_TASK_SECONDS = 20
+
+def add_task(name, url, params):
+    """
+    Adds the named task, unless it was already added. Chained tasks are 
+    named after their job and step, so a retried task can't start a second
+    chain of tasks for the same job.
+    """
+    try:
+        taskqueue.add(name=name, url=url, params=params)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        logging.info("Task %s already added", name)
+
+def queue_delete_job(job):
+    """Adds a task running the next step of the given DeleteJob"""
+    add_task("delete-job-%d-%d" % (job.key().id(), job.steps), 
+        "/tasks/delete", {"job": job.key().id()})
+
+class DeleteJobHandler(webapp.RequestHandler):
+    def post(self):
+        logging.debug("DeleteJobHandler#post")
+        
+        try:
+            job = DeleteJob.get_by_id(int(self.request.get("job")))
+        except ValueError:
+            job = None
+            
+        # Don't let the task queue retry jobs that are gone
+        if job is None or job.done:
+            logging.error("No delete job to run for %s", 
+                self.request.get("job"))
+            return
+            
+        if job.run(time.time() + DELETE_TASK_SECONDS):
+            logging.info("Deleted %s %s and its %d events", job.kind, 
+                job.slug, job.deleted)
+        else:
+            queue_delete_job(job)
+            
+def queue_slug_key_migration(migration):
+    """Adds a task running the next step of the given SlugKeyMigration"""
+    add_task("slug-key-migration-%d-%d" % (migration.key().id(), 
+        migration.steps), "/tasks/migrate", {"migration": migration.key().id()})
+        
+def start_slug_key_migration():
+    """
+    Install step keying services and statuses by slug, see main.py. The
+    migration writes the keyed_by_slug Setting once its events are done.
+    """
+    migration = SlugKeyMigration.start()
+    if migration:
+        queue_slug_key_migration(migration)
+    else:
+        start_event_parent_migration()
+
+class SlugKeyMigrationHandler(webapp.RequestHandler):
+    def post(self):
+        logging.debug("SlugKeyMigrationHandler#post")
+        
+        try:
+            migration = SlugKeyMigration.get_by_id(
+                int(self.request.get("migration")))
+        except ValueError:
+            migration = None
+            
+        if migration is None or migration.done:
+            logging.error("No slug key migration to run for %s", 
+                self.request.get("migration"))
+            return
+            
+        if migration.run(time.time() + MIGRATION_TASK_SECONDS):
+            logging.info("Re-pointed %d events to services and statuses "
+                "keyed by slug", migration.moved)
+            start_event_parent_migration()
+        else:
+            queue_slug_key_migration(migration)
+            
+def queue_event_parent_migration(migration):
+    """Adds a task running the next step of the given EventParentMigration"""
+    add_task("event-parent-migration-%d-%d" % (migration.key().id(), 
+        migration.steps), "/tasks/migrate-events", 
+        {"migration": migration.key().id()})
+        
+def start_event_parent_migration():
+    """
+    Install step moving events under their service, see main.py. It needs
+    the services keyed by slug, so until then it is started by the slug key
+    migration instead. The migration writes the parented_events Setting 
+    once it is done.
+    """
+    if Setting.all().filter('name = ', "keyed_by_slug").get() is None:
+        logging.info("Moving events once services are keyed by slug")
+        return
+    if Setting.all().filter('name = ', "parented_events").get() is None:
+        queue_event_parent_migration(EventParentMigration.start())
+
+class EventParentMigrationHandler(webapp.RequestHandler):
+    def post(self):
+        logging.debug("EventParentMigrationHandler#post")
+        
+        try:
+            migration = EventParentMigration.get_by_id(
+                int(self.request.get("migration")))
+        except ValueError:
+            migration = None
+            
+        if migration is None or migration.done:
+            logging.error("No event parent migration to run for %s", 
+                self.request.get("migration"))
+            return
+            
+        if migration.run(time.time() + MIGRATION_TASK_SECONDS):
+            logging.info("Moved %d events under their service", 
+                migration.moved)
+            start_backfills()
+        else:
+            queue_event_parent_migration(migration)
+            
+def queue_backfill(backfill):
+    """Adds a task running the next step of the given ServiceBackfill"""
+    add_task("backfill-%d-%d" % (backfill.key().id(), backfill.steps), 
+        "/tasks/backfill", {"backfill": backfill.key().id()})
+        
+def start_backfill(name):
+    """
+    Install step running the named ServiceBackfill, see main.py. It reads
+    events with ancestor queries, so until the events are moved under their
+    service it is started by the event parent migration instead. The 
+    backfill writes the Setting with its name once it is done.
+    """
+    if Setting.all().filter('name = ', "parented_events").get() is None:
+        logging.info("Running %s once events are moved", name)
+        return
+    if Setting.all().filter('name = ', name).get() is None:
+        queue_backfill(ServiceBackfill.start(name))
+        
+def start_current_event_backfill():
+    start_backfill(ServiceBackfill.CURRENT_EVENTS)
+    
+def start_service_day_backfill():
+    start_backfill(ServiceBackfill.SERVICE_DAYS)
+    
+def start_backfills():
+    start_current_event_backfill()
+    start_service_day_backfill()
+    
+class ServiceBackfillHandler(webapp.RequestHandler):
+    def post(self):
+        logging.debug("ServiceBackfillHandler#post")
+        
+        try:
+            backfill = ServiceBackfill.get_by_id(
+                int(self.request.get("backfill")))
+        except ValueError:
+            backfill = None
+            
+        if backfill is None or backfill.done:
+            logging.error("No backfill to run for %s", 
+                self.request.get("backfill"))
+            return
+            
+        if backfill.run(time.time() + MIGRATION_TASK_SECONDS):
+            logging.info("Ran %s for %d services", backfill.name, 
+                backfill.services)
+        else:
+            queue_backfill(backfill)
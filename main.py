@@ -27,6 +27,7 @@ import config
 import os
 import sys
 import logging
+import threading
 import wsgiref.handlers
 
 # Force sys.path to have our own directory first, so we can import from it.
@@ -39,67 +40,147 @@ from google.appengine.api import memcache
 from google.appengine.ext import webapp
 from google.appengine.api import users
 
-from handlers import site, api
+from handlers import tasks
+from utils import routing
 from models import Status, Setting
+from models import status_registry, request_cache
 
 
 # Log a message each time this module get loaded.
 logging.info('Loading %s, app version = %s',
              __name__, os.getenv('CURRENT_VERSION_ID'))
            
+# Install steps, in the order they run. Each writes a Setting with its name
+# once it's done, see install_once
+INSTALL_STEPS = [
+    # Check if defaults have been installed
+    ("installed_defaults", Status.install_defaults),
+    ("keyed_by_slug", tasks.start_slug_key_migration),
+    ("parented_events", tasks.start_event_parent_migration),
+    # Existing installs need the current event snapshot and the recent 
+    # ServiceDays of each service, filled in by tasks once the events were
+    # moved
+    ("backfilled_current_events", tasks.start_current_event_backfill),
+    ("backfilled_service_days", tasks.start_service_day_backfill),
+]
+
+# Whether this process checked the install steps already
+bootstrapped = False
+bootstrap_lock = threading.Lock()
+
+def install_once(steps):
+    """
+    Run each of the given (name, install) steps unless a Setting with the
+    name says it already ran. The install function is responsible for 
+    writing that Setting. Steps known to be done are remembered in memcache,
+    all read with a single call.
+    """
+    installed = memcache.get_multi([name for name, install in steps])
+    for name, install in steps:
+        if name in installed:
+            continue
+        if Setting.all().filter('name = ', name).get() is None:
+            logging.info("Running install step %s", name)
+            install()
+        if not memcache.add(name, True):
+            logging.error("Memcache set failed.")
+            
+def bootstrap():
+    """Check the install steps, once per process"""
+    global bootstrapped
+    if not bootstrapped:
+        bootstrap_lock.acquire()
+        try:
+            if not bootstrapped:
+                install_once(INSTALL_STEPS)
+                bootstrapped = True
+        finally:
+            bootstrap_lock.release()
+        
+class WarmupHandler(webapp.RequestHandler):
+    """
+    Prepares a new instance before it gets requests, see inbound_services 
+    in app.yaml
+    """
+    def get(self):
+        bootstrap()
+        status_registry.get_indexes()
+
 if (config.SITE["rich_client"]):  
-    serviceHandler = site.ServiceHandler
-    rootHandler = site.RootHandler
+    serviceHandler = "handlers.site.ServiceHandler"
+    rootHandler = "handlers.site.RootHandler"
 else:
-    rootHandler = site.BasicRootHandler
-    serviceHandler = site.BasicServiceHandler
+    rootHandler = "handlers.site.BasicRootHandler"
+    serviceHandler = "handlers.site.BasicServiceHandler"
 
+# Handlers are given by dotted path and only imported when first routed to,
+# so a cold start only imports what its request needs
 ROUTES = [
     ('/*$', rootHandler),
-    ('/debug', site.DebugHandler),
+    ('/debug', "handlers.site.DebugHandler"),
+    ('/_ah/warmup', WarmupHandler),
     #('/*[^/]', site.) redirect pages without slashed to pages with slashes
     
     #API
-    ('/403.html', site.UnauthorizedHandler),
-    ('/404.html', site.NotFoundHandler),
-    (r'/api/(.+)/services', api.ServicesListHandler),
-    (r'/api/(.+)/services/(.+)/events', api.EventsListHandler),
-    (r'/api/(.+)/services/(.+)/events/current', api.CurrentEventHandler),
-    (r'/api/(.+)/services/(.+)/events/(.+)', api.EventInstanceHandler),
-    (r'/api/(.+)/services/(.+)', api.ServiceInstanceHandler),
-    (r'/api/(.+)/statuses', api.StatusesListHandler),
-    (r'/api/(.+)/statuses/(.+)', api.StatusInstanceHandler),
-    (r'/api/(.+)/status-images', api.ImagesListHandler),
-    (r'/api/(.+)/levels', api.LevelsListHandler),
-    (r'/api/.*', api.NotFoundHandler),
+    (r'/403\.html', "handlers.site.UnauthorizedHandler"),
+    (r'/404\.html', "handlers.site.NotFoundHandler"),
+    (r'/api/(.+)/services', "handlers.api.ServicesListHandler"),
+    (r'/api/(.+)/services/(.+)/events', "handlers.api.EventsListHandler"),
+    (r'/api/(.+)/services/(.+)/events/current', "handlers.api.CurrentEventHandler"),
+    (r'/api/(.+)/services/(.+)/events/(.+)', "handlers.api.EventInstanceHandler"),
+    (r'/api/(.+)/services/(.+)', "handlers.api.ServiceInstanceHandler"),
+    (r'/api/(.+)/statuses', "handlers.api.StatusesListHandler"),
+    (r'/api/(.+)/statuses/(.+)', "handlers.api.StatusInstanceHandler"),
+    (r'/api/(.+)/status-images', "handlers.api.ImagesListHandler"),
+    (r'/api/(.+)/levels', "handlers.api.LevelsListHandler"),
+    (r'/api/(.+)/dashboard', "handlers.api.DashboardHandler"),
+    (r'/api/(.+)/cache', "handlers.api.CacheStatsHandler"),
+    (r'/api/(.+)/jobs/(.+)', "handlers.api.JobInstanceHandler"),
+    # (.+) matches across slashes, so routes matching any path ending with
+    # a given segment come after the routes they would otherwise shadow
+    (r'/api/(.+)/events', "handlers.api.BulkEventsHandler"),
+    (r'/api/(.+)/sync', "handlers.api.SyncHandler"),
+    (r'/api/.*', "handlers.api.NotFoundHandler"),
+    
+    #TASKS
+    (r'/tasks/delete', "handlers.tasks.DeleteJobHandler"),
+    (r'/tasks/migrate', "handlers.tasks.SlugKeyMigrationHandler"),
+    (r'/tasks/migrate-events', "handlers.tasks.EventParentMigrationHandler"),
+    (r'/tasks/backfill', "handlers.tasks.ServiceBackfillHandler"),
     
     #SITE
     (r'/services/(.+)/(.+)/(.+)/(.+)', serviceHandler),
     (r'/services/(.+)/(.+)/(.+)', serviceHandler),
     (r'/services/(.+)/(.+)', serviceHandler),
     (r'/services/(.+)', serviceHandler),
-    (r'/documentation/credentials', site.ProfileHandler),
-    (r'/documentation/verify', site.VerifyAccessHandler),
-    (r'/documentation/(.+)', site.DocumentationHandler),
+    (r'/documentation/credentials', "handlers.site.ProfileHandler"),
+    (r'/documentation/verify', "handlers.site.VerifyAccessHandler"),
+    (r'/documentation/(.+)', "handlers.site.DocumentationHandler"),
     
-    ('/.*$', site.NotFoundHandler),
+    ('/.*$', "handlers.site.NotFoundHandler"),
     
     
 ]
 
-def main():
-    # Check if defaults have been installed
-    installed_defaults = memcache.get("installed_defaults")
-    if installed_defaults is None:
-        installed_defaults = Setting.all().filter('name = ', 'installed_defaults').get()
-        if installed_defaults is None:
-            logging.info("Installing default statuses")
-            Status.install_defaults()
-        if not memcache.add("installed_defaults", True):
-            logging.error("Memcache set failed.")
+# Built once per process and reused by every request, main() included
+application = routing.WSGIApplication(routing.lazy_routes(ROUTES), 
+    debug=config.DEBUG)
 
-    application = webapp.WSGIApplication(ROUTES, debug=config.DEBUG)
-    wsgiref.handlers.CGIHandler().run(application)
+def wsgi_app(environ, start_response):
+    """
+    The WSGI application serving every request, for long-lived servers 
+    (see server.py) as well as main()
+    """
+    # Entities and results cached by the previous request are stale
+    request_cache.clear()
+    # Pick up status changes made by other instances
+    status_registry.validate()
+    
+    bootstrap()
+    return application(environ, start_response)
+
+def main():
+    wsgiref.handlers.CGIHandler().run(wsgi_app)
 
 if __name__ == "__main__":
     main()
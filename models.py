@@ -19,14 +19,145 @@
 # THE SOFTWARE.
 
 from google.appengine.ext import db
+from utils import versions
 import datetime
 from wsgiref.handlers import format_date_time
 from time import mktime
 from datetime import timedelta
 from datetime import date
 import config
+import threading
+import time
 import urlparse
 
+# Largest number of entities read or written in a single batch call
+BATCH_SIZE = 500
+
+# Number of services a ServiceBackfill fills in between saving progress
+BACKFILL_BATCH_SIZE = 50
+
+def event_rest(sid, start, status, message, informational, service, base_url):
+    """
+    Return a Python object representing an event. Shared by Event.rest and
+    the current event snapshot stored on Service
+    """
+    m = {}
+    m["sid"] = sid
+
+    stamp = mktime(start.timetuple())
+    m["timestamp"] = format_date_time(stamp)
+    m["status"] = status.rest(base_url)
+    m["message"] = str(message)
+    m["url"] = base_url + service.resource_url() + "/events/" + sid
+
+    if informational:
+        m["informational"] = informational
+    else:
+        m["informational"] = False
+    
+    return m
+
+class RequestCache(threading.local):
+    """
+    Entities and method results kept for the duration of a single request,
+    so that templates reading the same model method or reference several 
+    times only pay for it once. main() clears it at the start of every 
+    request.
+    
+    entities is an identity map from keys to the entities loaded through
+    get(). results holds the values of methods decorated with memoized,
+    by entity key.
+    """
+    
+    def __init__(self):
+        self.clear()
+        
+    def clear(self):
+        self.entities = {}
+        self.results = {}
+        
+    def get(self, keys):
+        """Return the entities with the given keys, like db.get"""
+        missing = [k for k in keys if k not in self.entities]
+        for i in range(0, len(missing), BATCH_SIZE):
+            batch = missing[i:i + BATCH_SIZE]
+            for key, entity in zip(batch, db.get(batch)):
+                self.entities[key] = entity
+        return [self.entities[k] for k in keys]
+        
+    def remember(self, entities):
+        """Add already loaded entities to the identity map"""
+        for entity in entities:
+            self.entities[entity.key()] = entity
+            
+    def forget(self, key):
+        """Drop what is known about the entity with the given key"""
+        self.entities.pop(key, None)
+        self.results.pop(key, None)
+        
+request_cache = RequestCache()
+
+def memoized(method):
+    """
+    A decorator keeping the result of a model method in request_cache, 
+    per entity and arguments. Arguments must be hashable.
+    """
+    name = method.__name__
+    
+    def memoize(self, *args):
+        if not self.is_saved():
+            return method(self, *args)
+        results = request_cache.results.setdefault(self.key(), {})
+        try:
+            return results[(name, args)]
+        except KeyError:
+            result = results[(name, args)] = method(self, *args)
+            return result
+            
+    memoize.__name__ = name
+    memoize.__doc__ = method.__doc__
+    return memoize
+
+def prefetch_references(entities, properties, known=()):
+    """
+    Resolve ReferenceProperties for a list of entities in one batch, so that
+    reading them afterwards doesn't cost a datastore get per entity.
+    
+    Statuses come from status_registry and entities passed in known are
+    used as they are. Every other referenced entity comes from request_cache,
+    which fetches those it hasn't seen yet with a single batched db.get.
+    
+    Arguments:
+    entities    -- list: The entities holding the references
+    properties  -- list: ReferenceProperties to resolve, e.g. Event.status
+    known       -- list: Already loaded entities that may be referenced
+    
+    """
+    fields = [(e, prop) for e in entities for prop in properties]
+    ref_keys = [prop.get_value_for_datastore(e) for e, prop in fields]
+    
+    request_cache.remember(known)
+    resolved = {}
+    
+    missing = []
+    for key in set(ref_keys):
+        if key is None or key in resolved:
+            continue
+        if key.kind() == "Status" and status_registry.get(key):
+            resolved[key] = status_registry.get(key)
+        else:
+            missing.append(key)
+            
+    for key, entity in zip(missing, request_cache.get(missing)):
+        if entity:
+            resolved[key] = entity
+            
+    for (entity, prop), key in zip(fields, ref_keys):
+        if key in resolved:
+            prop.__set__(entity, resolved[key])
+            
+    return entities
+
 class Level(object):
     """
     A fake db.Model object, just in case we want to actually store things
@@ -67,107 +198,6 @@ class Level(object):
         return False
      
 
-class Service(db.Model):
-    """A service to track
-
-        Properties:
-        name        -- string: The name of this service
-        description -- string: The function of the service
-        slug        -- stirng: URL friendly version of the name
-
-    """
-    @staticmethod
-    def get_by_slug(service_slug):
-        return Service.all().filter('slug = ', service_slug).get()
-        
-    def current_event(self):
-        event = self.events.order('-start').get()
-        return event
-
-
-    #Specialty function for front page
-    def last_five_days(self):
-        
-        
-        lowest = Status.default()
-        severity = lowest.severity
-        
-        yesterday = date.today() - timedelta(days=1)
-        ago = yesterday - timedelta(days=5)
-        
-        events = self.events.filter('start >', ago) \
-            .filter('start <', yesterday).fetch(100)
-        
-        stats = {}
-        
-        for i in range(5):
-            stats[yesterday.day] = {
-                "image": lowest.image,
-                "day": yesterday,
-            }
-            yesterday = yesterday - timedelta(days=1)
-        
-        for event in events:
-            if event.status.severity > severity:
-                stats[event.start.day]["image"] = "information"
-                stats[event.start.day]["information"] = True
-
-        results = []
-
-        keys = stats.keys()
-        keys.sort()
-        keys.reverse()
-
-        for k in keys:
-            results.append(stats[k])
-            
-        return results
-        
-        
-    def events_for_day(self, day):
-        """ Return the largest seveirty (of events) for a given day. If no 
-        events occured, return the lowest severity rating.
-        
-        Arguments: 
-        day         -- Date object: The day to summarize
-        
-        """
-        
-        next_day = day + timedelta(days=1)
-        
-        return self.events.filter('start >=', day) \
-            .filter('start <', next_day).fetch(40)
-            
-    def compare(self, other_status):
-        return 0
-    
-    slug = db.StringProperty(required=True)
-    name = db.StringProperty(required=True)
-    description = db.StringProperty(required=True)
-    
-    def sid(self):
-        return str(self.key())
-        
-    def resource_url(self):
-        return "/services/" + self.slug
-        
-    def rest(self, base_url):
-        """ Return a Python object representing this model"""
-
-        m = {}
-        m["name"] = str(self.name)
-        m["id"] = str(self.slug)
-        m["description"] = str(self.description)
-        m["url"] = base_url + self.resource_url()
-        
-        event = self.current_event()
-        if event:
-            m["current-event"] = event.rest(base_url)
-        else:
-            m["current-event"] = None
-
-        return m
-
 class Status(db.Model):
     """A possible system status
 
@@ -178,10 +208,21 @@ class Status(db.Model):
         image       -- string: Image in /images/status
         severity    -- int: The serverity of this status
 
+        Statuses are keyed by slug, see key_name_for. They are read through
+        status_registry, an in-process cache. Use cached=False to get an
+        entity that is safe to modify.
+
     """
     @staticmethod
-    def get_by_slug(status_slug):
-        return Status.all().filter('slug = ', status_slug).get()
+    def key_name_for(slug):
+        # Key names can't start with a digit, slugs can
+        return "slug:" + slug
+        
+    @staticmethod
+    def get_by_slug(status_slug, cached=True):
+        if cached:
+            return status_registry.get_by_slug(status_slug)
+        return Status.get_by_key_name(Status.key_name_for(status_slug))
         
     @staticmethod
     def default():
@@ -189,7 +230,10 @@ class Status(db.Model):
         Return the first status with a NORMAL level.
         """
         normal = Level.get_severity(Level.normal)
-        return Status.all().filter('severity == ', normal).get()
+        statuses = status_registry.get_by_severity(normal)
+        if statuses:
+            return statuses[0]
+        return None
 
     @staticmethod
     def install_defaults():
@@ -201,11 +245,14 @@ class Status(db.Model):
         warning = Level.get_severity(Level.warning)
         error = Level.get_severity(Level.error)
 
-        d = Status(name="Down", slug="down", image="cross-circle", severity=error, \
+        d = Status(key_name=Status.key_name_for("down"), name="Down", slug="down", \
+                       image="cross-circle", severity=error, \
                        description="The service is currently down")
-        u = Status(name="Up", slug="up", image="tick-circle", severity=normal, \
+        u = Status(key_name=Status.key_name_for("up"), name="Up", slug="up", \
+                       image="tick-circle", severity=normal, \
                        description="The service is up")
-        w = Status(name="Warning", slug="warning", image="exclamation", severity=warning, \
+        w = Status(key_name=Status.key_name_for("warning"), name="Warning", \
+                       slug="warning", image="exclamation", severity=warning, \
                        description="The service is experiencing intermittent problems")
 
         d.put()
@@ -222,6 +269,17 @@ class Status(db.Model):
     image = db.StringProperty(required=True)
     severity = db.IntegerProperty(required=True)
     
+    def put(self):
+        key = db.Model.put(self)
+        status_registry.bump()
+        request_cache.clear()
+        return key
+        
+    def delete(self):
+        db.Model.delete(self)
+        status_registry.bump()
+        request_cache.clear()
+    
     def image_url(self):
         return "/images/status/" + unicode(self.image) + ".png"
         
@@ -245,8 +303,384 @@ class Status(db.Model):
         return m
     
 
+class StatusRegistry(object):
+    """
+    Every Status, indexed by slug, by key and by severity.
+    
+    Statuses almost never change, so the registry is loaded once per 
+    instance. The statuses change version (see utils/versions.py) is bumped
+    whenever a status is written or deleted, and validate() (called at the
+    start of every request) drops the registry when the version has moved.
+    """
+    
+    def __init__(self):
+        self.version = None
+        self.indexes = None
+        
+    def validate(self):
+        """Drop the registry if the statuses version changed"""
+        version = versions.get(versions.STATUSES)
+        if version != self.version:
+            self.indexes = None
+            self.version = version
+            
+    def bump(self):
+        """Invalidate the registry on every instance"""
+        versions.bump(versions.STATUSES)
+        self.indexes = None
+        self.version = versions.get(versions.STATUSES)
+        
+    def load(self):
+        by_slug = {}
+        by_key = {}
+        by_severity = {}
+        statuses = []
+        
+        for status in Status.all():
+            by_slug[status.slug] = status
+            by_key[status.key()] = status
+            by_severity.setdefault(status.severity, []).append(status)
+            statuses.append(status)
+            
+        statuses.sort(key=lambda s: s.severity)
+        indexes = (by_slug, by_key, by_severity, statuses)
+        self.indexes = indexes
+        return indexes
+        
+    def get_indexes(self):
+        indexes = self.indexes
+        if indexes is None:
+            indexes = self.load()
+        return indexes
+        
+    def get_by_slug(self, slug):
+        return self.get_indexes()[0].get(slug)
+        
+    def get(self, key):
+        """Return the status with the given key, or None"""
+        return self.get_indexes()[1].get(key)
+        
+    def get_by_severity(self, severity):
+        """Return the statuses with the given severity"""
+        return self.get_indexes()[2].get(severity, [])
+        
+    def all(self):
+        """Return every status, ordered by severity"""
+        return self.get_indexes()[3]
+        
+status_registry = StatusRegistry()
+
+class Service(db.Model):
+    """A service to track
+
+        Properties:
+        name        -- string: The name of this service
+        description -- string: The function of the service
+        slug        -- stirng: URL friendly version of the name
+
+        Services are keyed by slug, see key_name_for, so they can be read
+        with a (batch) get instead of a query.
+
+        The current_* properties are a snapshot of the most recent event,
+        so that listing services doesn't need a query per service. They
+        are maintained by event_added and event_removed, and only written
+        in transactions on the service, see update.
+
+        summarized_since is the first day whose ServiceDay is kept up to
+        date, so a missing ServiceDay from then on means a day without
+        events. It is None for services created before ServiceDays, until
+        the ServiceDay backfill reaches them.
+
+    """
+    @staticmethod
+    def key_name_for(slug):
+        # Key names can't start with a digit, slugs can
+        return "slug:" + slug
+        
+    @staticmethod
+    def key_for(slug):
+        return db.Key.from_path('Service', Service.key_name_for(slug))
+        
+    @staticmethod
+    def get_by_slug(service_slug):
+        return Service.get_by_key_name(Service.key_name_for(service_slug))
+        
+    @staticmethod
+    def get_by_slugs(service_slugs):
+        """Return the service (or None) for each of the given slugs"""
+        key_names = [Service.key_name_for(s) for s in service_slugs]
+        services = []
+        for i in range(0, len(key_names), BATCH_SIZE):
+            services.extend(Service.get_by_key_name(key_names[i:i + BATCH_SIZE]))
+        return services
+        
+    @staticmethod
+    def create(slug, name, description):
+        """A new service, whose ServiceDays are kept from today on"""
+        return Service(key_name=Service.key_name_for(slug), name=name, 
+            slug=slug, description=description, summarized_since=date.today())
+        
+    @staticmethod
+    def update(key, **values):
+        """
+        Set the given properties of a service in a transaction, so that a
+        current event snapshot written meanwhile is kept. Returns the 
+        service, or None if it doesn't exist.
+        """
+        def txn():
+            service = Service.get(key)
+            if service is None:
+                return None
+            for name, value in values.items():
+                setattr(service, name, value)
+            service.put()
+            return service
+        request_cache.forget(key)
+        return db.run_in_transaction(txn)
+        
+    def event_query(self, keys_only=False):
+        """Query on the events of this service, which are its children"""
+        return db.Query(Event, keys_only=keys_only).ancestor(self)
+        
+    @memoized
+    def current_event(self):
+        if self.current_event_sid:
+            return request_cache.get([db.Key(self.current_event_sid)])[0]
+        return None
+        
+    def set_current_event(self, event):
+        """Copy the given event (or None) into the current event snapshot"""
+        if event:
+            self.current_event_sid = event.sid()
+            self.current_event_start = event.start
+            self.current_event_message = event.message
+            self.current_event_informational = bool(event.informational)
+            self.current_status = Event.status.get_value_for_datastore(event)
+        else:
+            self.current_event_sid = None
+            self.current_event_start = None
+            self.current_event_message = None
+            self.current_event_informational = False
+            self.current_status = None
+            
+    def refresh_current_event(self):
+        """Rebuild the current event snapshot from the events themselves"""
+        def txn():
+            service = Service.get(self.key())
+            if service is None:
+                return None
+            latest = service.event_query().order('-start').get()
+            service.set_current_event(latest)
+            service.put()
+            return service
+        request_cache.forget(self.key())
+        return db.run_in_transaction(txn)
+        
+    @staticmethod
+    def event_added(event):
+        """
+        Write the given new event, update the current event snapshot of 
+        its service if it is the most recent one, and add it to the 
+        ServiceDay of its day, all in one transaction on the service. 
+        Returns the service, or None if it was deleted, in which case the
+        event isn't written.
+        """
+        return Service.events_added([event])
+        
+    @staticmethod
+    def events_added(events):
+        """
+        Like event_added, for any number of new events of the same service,
+        in a single transaction
+        """
+        key = Event.service.get_value_for_datastore(events[0])
+        statuses = [status_registry.get(
+            Event.status.get_value_for_datastore(e)) for e in events]
+        days = sorted(set([e.start.date() for e in events]))
+        
+        def txn():
+            service = Service.get(key)
+            if service is None:
+                return None
+                
+            rollups = {}
+            keys = [ServiceDay.key_for(key, day) for day in days]
+            for day, rollup in zip(days, ServiceDay.get(keys)):
+                rollups[day] = rollup or ServiceDay.create(key, day)
+                
+            for event, status in zip(events, statuses):
+                latest = service.current_event_start
+                if latest is None or event.start >= latest:
+                    service.set_current_event(event)
+                rollups[event.start.date()].add(event, status)
+                
+            for i in range(0, len(events), BATCH_SIZE):
+                db.put(events[i:i + BATCH_SIZE])
+            db.put([service] + rollups.values())
+            return service
+        request_cache.forget(key)
+        return db.run_in_transaction(txn)
+        
+    @staticmethod
+    def event_removed(event):
+        """
+        Repair the current event snapshot and the ServiceDay of the event's
+        day after the event has been deleted
+        """
+        key = Event.service.get_value_for_datastore(event)
+        day = event.start.date()
+        
+        def txn():
+            service = Service.get(key)
+            if service is None:
+                return None
+            if service.current_event_sid == event.sid():
+                latest = service.event_query().order('-start').get()
+                service.set_current_event(latest)
+            # The events are in the service's entity group, so an event 
+            # added meanwhile can't be missed
+            db.put([service, ServiceDay.build(key, day)])
+            return service
+        request_cache.forget(key)
+        request_cache.forget(event.key())
+        return db.run_in_transaction(txn)
+        
+    def history(self, days):
+        """
+        Return the ServiceDay summaries for the given days, in the same order
+        
+        Arguments:
+        days        -- list of Date objects: The days to summarize
+        
+        """
+        rollups = ServiceDay.get_for([self], days)
+        return [rollups[(self.key(), day)] for day in days]
+
+    #Specialty function for front page
+    @memoized
+    def last_five_days(self):
+        
+        lowest = Status.default()
+        severity = lowest.severity
+        
+        yesterday = date.today() - timedelta(days=1)
+        days = [yesterday - timedelta(days=i) for i in range(5)]
+        
+        results = []
+        
+        for rollup in self.history(days):
+            stats = {
+                "image": lowest.image,
+                "day": rollup.day,
+            }
+            
+            if rollup.severity > severity:
+                stats["image"] = "information"
+                stats["information"] = True
+                
+            results.append(stats)
+            
+        return results
+        
+        
+    @memoized
+    def events_for_day(self, day):
+        """ Return the ServiceDay summarizing the events of a given day. Its
+        severity is the largest severity of the events, or 0 if no events
+        occured.
+        
+        Arguments: 
+        day         -- Date object: The day to summarize
+        
+        """
+        
+        return self.history([day])[0]
+            
+    def compare(self, other_status):
+        return 0
+    
+    slug = db.StringProperty(required=True)
+    name = db.StringProperty(required=True)
+    description = db.StringProperty(required=True)
+    
+    current_event_sid = db.StringProperty()
+    current_event_start = db.DateTimeProperty()
+    current_event_message = db.TextProperty()
+    current_event_informational = db.BooleanProperty(default=False)
+    current_status = db.ReferenceProperty(Status, 
+        collection_name="current_services")
+    
+    summarized_since = db.DateProperty()
+    
+    def sid(self):
+        return str(self.key())
+        
+    def resource_url(self):
+        return "/services/" + self.slug
+        
+    def current_event_rest(self, base_url):
+        """ Return a Python object representing the current event"""
+        if not self.current_event_sid:
+            return None
+            
+        status = status_registry.get(
+            Service.current_status.get_value_for_datastore(self))
+        return event_rest(self.current_event_sid, self.current_event_start,
+            status, self.current_event_message,
+            self.current_event_informational, self, base_url)
+        
+    def rest(self, base_url):
+        """ Return a Python object representing this model"""
+
+        m = {}
+        m["name"] = str(self.name)
+        m["id"] = str(self.slug)
+        m["description"] = str(self.description)
+        m["url"] = base_url + self.resource_url()
+        m["current-event"] = self.current_event_rest(base_url)
+
+        return m
+
 class Event(db.Model):
+    """An event of a service
+
+        Events are children of their service, so the events of a service
+        are read with ancestor queries, and whether an event belongs to a 
+        service can be told from its key. Events created before that were
+        moved under their service by EventParentMigration, and remember 
+        their previous sid in legacy_sid.
 
+    """
+    @staticmethod
+    def get_for_service(service_slug, sid):
+        """
+        Return the service with the given slug and its event with the given
+        sid, either being None if it doesn't exist, with one batch get
+        """
+        service_key = Service.key_for(service_slug)
+        try:
+            key = db.Key(sid)
+        except (db.BadKeyError, db.BadArgumentError):
+            key = None
+            
+        if key and key.kind() == "Event" and key.parent() is None:
+            # The sid of an event from before events had a parent
+            moved = db.Query(Event, keys_only=True).filter('legacy_sid =', 
+                sid).get()
+            if moved:
+                key = moved
+                
+        if key is None or key.kind() != "Event" or \
+            key.parent() not in (service_key, None):
+            return Service.get(service_key), None
+            
+        service, event = db.get([service_key, key])
+        
+        # Events not moved yet only tell their service by reference
+        if event and Event.service.get_value_for_datastore(event) != service_key:
+            event = None
+        return service, event
+        
     start = db.DateTimeProperty(required=True, auto_now_add=True)
 
     # We want this to be required, but it would break all current installs
@@ -257,6 +691,7 @@ class Event(db.Model):
     message = db.TextProperty(required=True)
     service = db.ReferenceProperty(Service, required=True, 
         collection_name="events")
+    legacy_sid = db.StringProperty()
         
     def duration(self):
         # calculate the difference between start and end
@@ -271,23 +706,645 @@ class Event(db.Model):
     
     def rest(self, base_url):
         """ Return a Python object representing this model"""
+        status = status_registry.get(Event.status.get_value_for_datastore(self))
+        return event_rest(self.sid(), self.start, status, self.message,
+            self.informational, self.service, base_url)
         
-        m = {}
-        m["sid"] = self.sid()
+class ServiceDay(db.Model):
+    """A summary of the events of one service on a single day (UTC)
 
-        stamp = mktime(self.start.timetuple())
-        m["timestamp"] = format_date_time(stamp)
-        m["status"] = self.status.rest(base_url)
-        m["message"] = str(self.message)
-        m["url"] = base_url + self.resource_url()
+        ServiceDays are children of their service and keyed by date, so the
+        history of any number of services can be read with one batch get.
+        They are updated whenever an event is added or removed, see
+        Service.event_added and Service.event_removed. Past days of older
+        services that were never summarized are built from their events on
+        first read, see get_for.
+
+        Properties:
+        day           -- date: The day summarized
+        severity      -- int: The highest severity of the day's events
+        informational -- boolean: Whether any of the events was informational
+        events        -- int: The number of events
+        statuses      -- list: Keys of the statuses used by the events
 
-        if self.informational:
-            m["informational"] = self.informational
+    """
+    day = db.DateProperty(required=True)
+    severity = db.IntegerProperty(default=0)
+    informational = db.BooleanProperty(default=False)
+    events = db.IntegerProperty(default=0)
+    statuses = db.ListProperty(db.Key)
+    
+    @staticmethod
+    def key_name_for(day):
+        return day.strftime("d%Y%m%d")
+    
+    @staticmethod
+    def key_for(service_key, day):
+        return db.Key.from_path('ServiceDay', ServiceDay.key_name_for(day), 
+            parent=service_key)
+            
+    @staticmethod
+    def create(service_key, day):
+        return ServiceDay(parent=service_key, 
+            key_name=ServiceDay.key_name_for(day), day=day)
+            
+    def add(self, event, status):
+        """Count the given event, which has the given status"""
+        self.events += 1
+        self.informational = self.informational or bool(event.informational)
+        
+        if status:
+            self.severity = max(self.severity, status.severity)
+            if status.key() not in self.statuses:
+                self.statuses.append(status.key())
+                
+    @staticmethod
+    def build(service_key, day):
+        """Summarize a day from the events themselves"""
+        rollup = ServiceDay.create(service_key, day)
+        
+        start = datetime.datetime.combine(day, datetime.time())
+        query = Event.all().ancestor(service_key)
+        query.filter('start >=', start)
+        query.filter('start <', start + timedelta(days=1))
+        events = list(query)
+        
+        for e in events:
+            status = status_registry.get(Event.status.get_value_for_datastore(e))
+            rollup.add(e, status)
+            
+        return rollup
+        
+    @staticmethod
+    def get_for(services, days):
+        """
+        Return a dict mapping (service key, day) to a ServiceDay for every
+        combination of the given services and days. A missing ServiceDay
+        is an empty day, unless it is older than the service's 
+        summarized_since: those are built from their events and stored,
+        once the events are under their services.
+        """
+        pairs = [(s, d) for s in services for d in days]
+        keys = [ServiceDay.key_for(s.key(), d) for s, d in pairs]
+        
+        rollups = []
+        for i in range(0, len(keys), BATCH_SIZE):
+            rollups.extend(ServiceDay.get(keys[i:i + BATCH_SIZE]))
+        
+        today = date.today()
+        results = {}
+        built = []
+        
+        for (service, day), rollup in zip(pairs, rollups):
+            if rollup is None:
+                since = service.summarized_since
+                if (since is None or day < since) and \
+                    Setting.exists("parented_events"):
+                    rollup = ServiceDay.build(service.key(), day)
+                    if day < today:
+                        built.append(rollup)
+                else:
+                    # No events that day, or they aren't under the service 
+                    # yet
+                    rollup = ServiceDay.create(service.key(), day)
+            results[(service.key(), day)] = rollup
+            
+        for i in range(0, len(built), BATCH_SIZE):
+            db.put(built[i:i + BATCH_SIZE])
+            
+        return results
+        
+    @staticmethod
+    def refresh_severity(status):
+        """
+        Recompute the severity of every day which used the given status,
+        after the severity of that status was changed
+        """
+        rollups = list(ServiceDay.all().filter('statuses =', status.key()))
+        
+        for rollup in rollups:
+            severities = [0]
+            for key in rollup.statuses:
+                s = status_registry.get(key)
+                if s:
+                    severities.append(s.severity)
+            rollup.severity = max(severities)
+            
+        for i in range(0, len(rollups), BATCH_SIZE):
+            db.put(rollups[i:i + BATCH_SIZE])
+            
+    @staticmethod
+    def rebuild_for_status(status):
+        """Rebuild every day which used the given status from its events"""
+        rollups = [ServiceDay.build(r.parent_key(), r.day) for r in 
+            ServiceDay.all().filter('statuses =', status.key())]
+            
+        for i in range(0, len(rollups), BATCH_SIZE):
+            db.put(rollups[i:i + BATCH_SIZE])
+            
+    @staticmethod
+    def delete_for(service):
+        """Delete every ServiceDay of the given service"""
+        query = db.Query(ServiceDay, keys_only=True).ancestor(service)
+        keys = query.fetch(BATCH_SIZE)
+        while keys:
+            db.delete(keys)
+            keys = query.fetch(BATCH_SIZE)
+            
+class DeleteJob(db.Model):
+    """A service or status being deleted, with everything referencing it
+    
+        Deleting a service or status can mean deleting years of events, 
+        more than a request can do. The handlers start a DeleteJob instead,
+        and a chain of tasks (see handlers/tasks.py) deletes the events in 
+        batches of BATCH_SIZE keys, walking a keys-only query with a cursor.
+        
+        A deleted service is removed when the job starts, so it disappears
+        immediately. A deleted status is removed once its events are gone,
+        since events can't be shown without their status.
+        
+        Properties:
+        kind        -- string: SERVICE or STATUS
+        target      -- key: The service or status being deleted
+        slug        -- string: Slug of the service or status
+        cursor      -- text: Where the next batch of events starts
+        deleted     -- int: The number of events deleted so far
+        steps       -- int: The number of times run() was called
+        done        -- boolean: Whether everything has been deleted
+        
+    """
+    SERVICE = "service"
+    STATUS = "status"
+    
+    kind = db.StringProperty(required=True, choices=[SERVICE, STATUS])
+    target = db.KeyProperty(required=True)
+    slug = db.StringProperty(required=True)
+    cursor = db.TextProperty()
+    deleted = db.IntegerProperty(default=0)
+    steps = db.IntegerProperty(default=0)
+    done = db.BooleanProperty(default=False)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+    
+    @staticmethod
+    def start(entity):
+        """Create the job deleting the given Service or Status"""
+        if isinstance(entity, Service):
+            kind = DeleteJob.SERVICE
         else:
-            m["informational"] = False
+            kind = DeleteJob.STATUS
+            
+        job = DeleteJob(kind=kind, target=entity.key(), slug=entity.slug)
+        job.put()
+        
+        if kind == DeleteJob.SERVICE:
+            entity.delete()
+            versions.bump(versions.GLOBAL, versions.service(entity.slug))
+            
+        return job
+        
+    @staticmethod
+    def pending(key):
+        """
+        Whether the service or status with the given key is still being 
+        deleted. Services are keyed by slug, so a service created again 
+        before its job is done would lose its new events to the job.
+        """
+        for job in DeleteJob.all().filter('target =', key):
+            if not job.done:
+                return True
+        return False
+        
+    def query(self):
+        """Keys of the events left to delete"""
+        if self.kind == DeleteJob.SERVICE:
+            # Rather than an ancestor query, to also find events that were 
+            # not moved under their service yet
+            query = db.Query(Event, keys_only=True).filter('service =', 
+                self.target)
+        else:
+            query = db.Query(Event, keys_only=True).filter('status =', 
+                self.target)
+        if self.cursor:
+            query.with_cursor(self.cursor)
+        return query
+        
+    def run(self, deadline):
+        """
+        Delete batches of events until none are left or the deadline (a
+        time.time() value) has passed, then save progress. Returns whether
+        the job is done.
+        """
+        self.steps += 1
+        while not self.done and time.time() < deadline:
+            query = self.query()
+            keys = query.fetch(BATCH_SIZE)
+            
+            if keys:
+                db.delete(keys)
+                self.deleted += len(keys)
+                self.cursor = query.cursor()
+            elif self.cursor:
+                # Start over once to catch events added meanwhile
+                self.cursor = None
+            else:
+                self.finish()
+                
+        self.put()
+        return self.done
+        
+    def finish(self):
+        """Delete what's left once the events are gone"""
+        if self.kind == DeleteJob.SERVICE:
+            ServiceDay.delete_for(self.target)
+        else:
+            status = Status.get(self.target)
+            if status:
+                names = [versions.GLOBAL]
+                for service in status.current_services:
+                    service.refresh_current_event()
+                    names.append(versions.service(service.slug))
+                ServiceDay.rebuild_for_status(status)
+                status.delete()
+                versions.bump(*names)
+                
+        self.cursor = None
+        self.done = True
+        
+    def resource_url(self):
+        return "/jobs/" + str(self.key().id())
+        
+    def rest(self, base_url):
+        """ Return a Python object representing this model"""
+        
+        m = {}
+        m["id"] = str(self.key().id())
+        m["kind"] = self.kind
+        m["target"] = str(self.slug)
+        m["deleted"] = self.deleted
+        m["done"] = self.done
+        m["url"] = base_url + self.resource_url()
         
         return m
+
+def rekeyed(entity, key_name, **values):
+    """
+    Return a copy of the given entity with the given key name. Keyword
+    arguments replace property values, or give the parent of the copy.
+    """
+    for name, prop in entity.properties().items():
+        if name not in values:
+            values[name] = prop.get_value_for_datastore(entity)
+    return entity.__class__(key_name=key_name, **values)
+
+class SlugKeyMigration(db.Model):
+    """Moves services and statuses created before they were keyed by slug
+    
+        start() copies each Service and Status to one keyed by its slug and
+        deletes the original, which is quick as there are few of them. The
+        events are then re-pointed to the copies by a chain of tasks (see 
+        handlers/tasks.py), BATCH_SIZE events at a time like a DeleteJob.
+        Until it is done, events not yet re-pointed are missing from the
+        history of their service.
+        
+        Properties:
+        old_keys    -- list: Keys of the services and statuses moved
+        new_keys    -- list: Keys of their copies, in the same order
+        cursor      -- text: Where the next batch of events starts
+        moved       -- int: The number of events re-pointed so far
+        steps       -- int: The number of times run() was called
+        done        -- boolean: Whether every event has been re-pointed
+        
+    """
+    old_keys = db.ListProperty(db.Key)
+    new_keys = db.ListProperty(db.Key)
+    cursor = db.TextProperty()
+    moved = db.IntegerProperty(default=0)
+    steps = db.IntegerProperty(default=0)
+    done = db.BooleanProperty(default=False)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+    
+    @staticmethod
+    def start():
+        """
+        Move the services and statuses, and return the migration left to
+        run on their events. Returns None when there is nothing to move.
+        """
+        for migration in SlugKeyMigration.all():
+            if not migration.done:
+                return migration
+                
+        moved = {}
+        copies = []
+        
+        for status in Status.all():
+            key_name = Status.key_name_for(status.slug)
+            if status.key().name() != key_name:
+                copy = rekeyed(status, key_name)
+                moved[status.key()] = copy.key()
+                copies.append(copy)
+                
+        for service in Service.all():
+            key_name = Service.key_name_for(service.slug)
+            current = Service.current_status.get_value_for_datastore(service)
+            if service.key().name() != key_name:
+                copy = rekeyed(service, key_name,
+                    current_status=moved.get(current, current))
+                moved[service.key()] = copy.key()
+                copies.append(copy)
+            elif current in moved:
+                service.current_status = moved[current]
+                copies.append(service)
+                
+        if not moved:
+            s = Setting(name="keyed_by_slug")
+            s.put()
+            return None
+            
+        migration = SlugKeyMigration(old_keys=moved.keys(), 
+            new_keys=moved.values())
+        migration.put()
+        
+        for i in range(0, len(copies), BATCH_SIZE):
+            db.put(copies[i:i + BATCH_SIZE])
+        old_keys = moved.keys()
+        for i in range(0, len(old_keys), BATCH_SIZE):
+            db.delete(old_keys[i:i + BATCH_SIZE])
+            
+        # Batched puts skip Status.put
+        status_registry.bump()
+        request_cache.clear()
+        versions.bump(versions.GLOBAL, 
+            *[versions.service(c.slug) for c in copies if isinstance(c, Service)])
+        return migration
         
+    def run(self, deadline):
+        """
+        Re-point batches of events until none are left or the deadline (a
+        time.time() value) has passed, then save progress. Returns whether
+        the migration is done.
+        """
+        moved = dict(zip(self.old_keys, self.new_keys))
+        self.steps += 1
+        
+        while not self.done and time.time() < deadline:
+            query = Event.all()
+            if self.cursor:
+                query.with_cursor(self.cursor)
+            events = query.fetch(BATCH_SIZE)
+            
+            if events:
+                changed = []
+                for e in events:
+                    service = Event.service.get_value_for_datastore(e)
+                    status = Event.status.get_value_for_datastore(e)
+                    if service in moved or status in moved:
+                        e.service = moved.get(service, service)
+                        e.status = moved.get(status, status)
+                        changed.append(e)
+                db.put(changed)
+                self.moved += len(changed)
+                self.cursor = query.cursor()
+            else:
+                self.finish(moved)
+                
+        self.put()
+        return self.done
+        
+    def finish(self, moved):
+        """
+        Drop the ServiceDays of the moved services, and point those using
+        the moved statuses at their copies. The events aren't under their
+        services yet, so the days of the copies are summarized by the 
+        ServiceDay backfill, see ServiceBackfill.
+        """
+        rollups = []
+        service_keys = []
+        
+        for old_key, new_key in moved.items():
+            if old_key.kind() == "Service":
+                ServiceDay.delete_for(old_key)
+                service_keys.append(new_key)
+                    
+        for old_key in moved.keys():
+            if old_key.kind() == "Status":
+                for r in ServiceDay.all().filter('statuses =', old_key):
+                    r.statuses = [moved.get(k, k) for k in r.statuses]
+                    rollups.append(r)
+                    
+        for i in range(0, len(rollups), BATCH_SIZE):
+            db.put(rollups[i:i + BATCH_SIZE])
+            
+        names = [versions.GLOBAL]
+        for service in Service.get(service_keys):
+            if service:
+                names.append(versions.service(service.slug))
+        versions.bump(*names)
+        s = Setting(name="keyed_by_slug")
+        s.put()
+        
+        self.cursor = None
+        self.done = True
+
+class EventParentMigration(db.Model):
+    """Moves events created before they were children of their service
+    
+        Each event is copied under its service, keyed by the id of the 
+        original which is then deleted, by a chain of tasks (see 
+        handlers/tasks.py) BATCH_SIZE events at a time like a DeleteJob. The
+        copies keep the sid of the original in legacy_sid, so that old event
+        URLs still work. Until it is done, events not yet moved are missing
+        from the history of their service.
+        
+        Runs after the SlugKeyMigration, so events are moved under the slug
+        keyed services.
+        
+        Properties:
+        cursor      -- text: Where the next batch of events starts
+        moved       -- int: The number of events moved so far
+        steps       -- int: The number of times run() was called
+        done        -- boolean: Whether every event has been moved
+        
+    """
+    cursor = db.TextProperty()
+    moved = db.IntegerProperty(default=0)
+    steps = db.IntegerProperty(default=0)
+    done = db.BooleanProperty(default=False)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+    
+    @staticmethod
+    def start():
+        """Return the migration, creating it unless one is running"""
+        for migration in EventParentMigration.all():
+            if not migration.done:
+                return migration
+                
+        migration = EventParentMigration()
+        migration.put()
+        return migration
+        
+    def run(self, deadline):
+        """
+        Move batches of events until none are left or the deadline (a
+        time.time() value) has passed, then save progress. Returns whether
+        the migration is done.
+        """
+        self.steps += 1
+        
+        while not self.done and time.time() < deadline:
+            query = Event.all()
+            if self.cursor:
+                query.with_cursor(self.cursor)
+            events = query.fetch(BATCH_SIZE)
+            
+            legacy = [e for e in events if e.parent_key() is None]
+            copies = [rekeyed(e, "e" + str(e.key().id_or_name()), 
+                parent=Event.service.get_value_for_datastore(e), 
+                legacy_sid=e.sid()) for e in legacy]
+            
+            db.put(copies)
+            self.repoint(legacy, copies)
+            db.delete(legacy)
+            self.moved += len(copies)
+            self.cursor = query.cursor()
+            
+            # Keys without a parent sort before the keys of the services'
+            # children, so the first child means every event was moved
+            if len(legacy) < len(events) or len(events) < BATCH_SIZE:
+                self.finish()
+                
+        self.put()
+        return self.done
+        
+    def repoint(self, events, copies):
+        """Point current event snapshots at the copies of the given events"""
+        copy_sids = {}
+        service_keys = set()
+        for event, copy in zip(events, copies):
+            copy_sids[event.sid()] = copy.sid()
+            service_keys.add(copy.parent_key())
+            
+        def txn(key):
+            service = Service.get(key)
+            if service and service.current_event_sid in copy_sids:
+                service.current_event_sid = copy_sids[service.current_event_sid]
+                service.put()
+                
+        for key in service_keys:
+            db.run_in_transaction(txn, key)
+            request_cache.forget(key)
+            
+    def finish(self):
+        names = [versions.GLOBAL]
+        for service in Service.all():
+            names.append(versions.service(service.slug))
+        versions.bump(*names)
+        
+        s = Setting(name="parented_events")
+        s.put()
+        
+        self.cursor = None
+        self.done = True
+
+class ServiceBackfill(db.Model):
+    """Fills in what is kept on each service, for services created before
+    
+        Services are walked with a cursor by a chain of tasks (see 
+        handlers/tasks.py), BACKFILL_BATCH_SIZE services at a time, each 
+        costing a query and a put. The backfills read events with ancestor
+        queries, so they run once the EventParentMigration is done.
+        
+        Properties:
+        name        -- string: What is filled in, also the name of the 
+                       install step and of the Setting written once done
+        cursor      -- text: Where the next batch of services starts
+        services    -- int: The number of services filled in so far
+        steps       -- int: The number of times run() was called
+        done        -- boolean: Whether every service was filled in
+        
+    """
+    # The current event snapshot, see Service.set_current_event
+    CURRENT_EVENTS = "backfilled_current_events"
+    # The ServiceDays of today and yesterday, after which the service's 
+    # days are kept up to date. Older days are built on first read
+    SERVICE_DAYS = "backfilled_service_days"
+    
+    name = db.StringProperty(required=True, 
+        choices=[CURRENT_EVENTS, SERVICE_DAYS])
+    cursor = db.TextProperty()
+    services = db.IntegerProperty(default=0)
+    steps = db.IntegerProperty(default=0)
+    done = db.BooleanProperty(default=False)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+    
+    @staticmethod
+    def start(name):
+        """Return the named backfill, creating it unless one is running"""
+        for backfill in ServiceBackfill.all().filter('name =', name):
+            if not backfill.done:
+                return backfill
+                
+        backfill = ServiceBackfill(name=name)
+        backfill.put()
+        return backfill
+        
+    def run(self, deadline):
+        """
+        Fill in batches of services until none are left or the deadline (a
+        time.time() value) has passed, then save progress. Returns whether
+        the backfill is done.
+        """
+        self.steps += 1
+        
+        while not self.done and time.time() < deadline:
+            query = Service.all()
+            if self.cursor:
+                query.with_cursor(self.cursor)
+            services = query.fetch(BACKFILL_BATCH_SIZE)
+            
+            for service in services:
+                self.backfill(service)
+            if services:
+                versions.bump(*[versions.service(s.slug) for s in services])
+            self.services += len(services)
+            self.cursor = query.cursor()
+            
+            if len(services) < BACKFILL_BATCH_SIZE:
+                self.finish()
+                
+        self.put()
+        return self.done
+        
+    def backfill(self, service):
+        if self.name == ServiceBackfill.CURRENT_EVENTS:
+            service.refresh_current_event()
+            return
+            
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        
+        def txn():
+            latest = Service.get(service.key())
+            if latest is None:
+                return
+            latest.summarized_since = yesterday
+            db.put([latest] + [ServiceDay.build(latest.key(), day) 
+                for day in [today, yesterday]])
+        db.run_in_transaction(txn)
+        request_cache.forget(service.key())
+            
+    def finish(self):
+        versions.bump(versions.GLOBAL)
+        
+        s = Setting(name=self.name)
+        s.put()
+        
+        self.cursor = None
+        self.done = True
+
 class Profile(db.Model):
     owner = db.UserProperty(required=True)
     token = db.StringProperty(required=True)
@@ -297,6 +1354,21 @@ class AuthRequest(db.Model):
     owner = db.UserProperty(required=True)
     request_secret = db.StringProperty()
 
+# Names of the Settings found by Setting.exists in this process
+known_settings = set()
+
 class Setting(db.Model):
     name = db.StringProperty(required=True)
+    
+    @staticmethod
+    def exists(name):
+        """
+        Whether a Setting with the given name was written. Settings are 
+        never deleted, so those found are remembered by the process.
+        """
+        if name not in known_settings:
+            if Setting.all().filter('name =', name).get() is None:
+                return False
+            known_settings.add(name)
+        return True
 
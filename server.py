@@ -0,0 +1,960 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Standalone server, to host Stashboard outside of App Engine
+
+    python server.py --sdk /usr/local/google_appengine [options]
+
+The server process owns the App Engine API stubs of the SDK: the datastore
+(kept in an SQLite file), memcache, the task queue and the users service.
+Requests are served by a pool of worker processes, each running a pool of
+threads, which forward their API calls to the server process. Connections
+are kept alive between requests: idle connections wait in the poll loop of
+their worker, and only hold a thread while a request is served.
+
+Workers are separate Python processes which import the application when
+they start, so a SIGHUP reloads the code: new workers are started, and the
+old ones finish the requests they are serving and exit. The datastore, the
+cache and queued tasks are kept. SIGTERM or SIGINT stops the server the 
+same way.
+
+URLs are handled as app.yaml says: static files are served by the workers,
+and "login: admin" URLs are only served to administrators and to the task
+queue. Queued tasks are run by the server process, which posts them to the
+workers.
+
+There are no Google Accounts: behind a load balancer, the signed in user is
+read from the request header given by --user-header, which the load 
+balancer must set (and strip from client requests). The users given by
+--admin are administrators. OAuth is not available, so API writes need an
+administrator signed in this way.
+
+Options:
+  --sdk PATH          The App Engine SDK directory (required)
+  --host HOST         Address to listen on (default 127.0.0.1)
+  --port PORT         Port to listen on (default 8080)
+  --processes N       Number of worker processes (default 1)
+  --threads N         Number of requests each worker process serves at 
+                      once (default 10)
+  --keep-alive SECS   How long idle connections are kept open (default 15)
+  --datastore PATH    The datastore file (default stashboard.datastore)
+  --api-socket PATH   The socket API calls are forwarded to (default: a
+                      temporary file)
+  --user-header NAME  The request header with the signed in user's email
+  --admin EMAIL       An administrator; can be given several times
+  --app-id ID         The application id (default: from app.yaml)
+
+"python server.py --cgi" runs main.py as a CGI script would, with the API
+calls forwarded to a running server given by --api-socket. It is used by
+benchmarks/server_throughput.py to compare with the CGI path.
+"""
+
+import BaseHTTPServer
+import Queue
+import SocketServer
+import UserDict
+import base64
+import cPickle as pickle
+import errno
+import httplib
+import logging
+import mimetypes
+import optparse
+import os
+import re
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+# The API services forwarded to the server process
+SERVICES = ["datastore_v3", "memcache", "taskqueue", "user", "urlfetch"]
+
+# The services whose stubs are not thread safe, whose calls are run one at a
+# time. The SQLite datastore stub locks its own connection, and the user and
+# URL fetch stubs keep no state.
+LOCKED_SERVICES = ["memcache", "taskqueue"]
+
+# Request header proving a request was sent by the task runner, whose value
+# is a secret shared by the server process and its workers
+TASK_HEADER = "X-Stashboard-Task"
+TASK_SECRET_VARIABLE = "STASHBOARD_TASK_SECRET"
+
+# Seconds between checks of the task queue, of the worker processes, and
+# of the idle connections of a worker
+TASK_INTERVAL = 1.0
+SUPERVISE_INTERVAL = 1.0
+POLL_INTERVAL = 1.0
+
+def parse_options(argv):
+    parser = optparse.OptionParser(usage="python server.py --sdk PATH [options]")
+    parser.add_option("--sdk")
+    parser.add_option("--host", default="127.0.0.1")
+    parser.add_option("--port", type="int", default=8080)
+    parser.add_option("--processes", type="int", default=1)
+    parser.add_option("--threads", type="int", default=10)
+    parser.add_option("--keep-alive", type="float", default=15.0)
+    parser.add_option("--datastore", default=os.path.join(ROOT, 
+        "stashboard.datastore"))
+    parser.add_option("--api-socket")
+    parser.add_option("--user-header")
+    parser.add_option("--admin", action="append", default=[])
+    parser.add_option("--app-id")
+    parser.add_option("--worker", action="store_true", default=False)
+    parser.add_option("--listener", type="int")
+    parser.add_option("--cgi", action="store_true", default=False)
+    
+    options, args = parser.parse_args(argv)
+    if not options.sdk:
+        parser.error("--sdk is required")
+    return options
+    
+def add_sdk_to_path(sdk):
+    sys.path[0:0] = [ROOT, os.path.join(ROOT, "utils/external"), sdk,
+        os.path.join(sdk, "lib", "django_1_1"),
+        os.path.join(sdk, "lib", "webob"),
+        os.path.join(sdk, "lib", "yaml", "lib")]
+        
+def read_app_yaml():
+    import yaml
+    f = open(os.path.join(ROOT, "app.yaml"))
+    try:
+        return yaml.safe_load(f)
+    finally:
+        f.close()
+        
+def send_message(sock, message):
+    data = pickle.dumps(message, 2)
+    sock.sendall(struct.pack("!I", len(data)) + data)
+    
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+    
+def receive_message(sock):
+    size = struct.unpack("!I", receive_exactly(sock, 4))[0]
+    return pickle.loads(receive_exactly(sock, size))
+    
+def class_path(obj):
+    return obj.__class__.__module__, obj.__class__.__name__
+    
+def load_class(path):
+    module_name, name = path
+    module = __import__(module_name, {}, {}, [name])
+    return getattr(module, name)
+    
+
+class APIServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    Runs the API calls of the workers on the stubs of the server process.
+    Each worker thread keeps a connection, and calls are sent as pickled
+    (service, call, request class, encoded request, response class) tuples.
+    Calls run concurrently, except those of the services given a lock.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, path, locks):
+        SocketServer.UnixStreamServer.__init__(self, path, APIRequestHandler)
+        self.locks = locks
+        
+    def call(self, service, call, request, response):
+        from google.appengine.api import apiproxy_stub_map
+        from google.appengine.runtime import apiproxy_errors
+        
+        if service == "user" and "OAuth" in call:
+            # Without this the stub signs every request in as its example
+            # OAuth user, see the module docstring
+            from google.appengine.api import user_service_pb
+            raise apiproxy_errors.ApplicationError(getattr(
+                user_service_pb.UserServiceError, "OAUTH_INVALID_REQUEST", 2))
+                
+        stub = apiproxy_stub_map.apiproxy.GetStub(service)
+        lock = self.locks.get(service)
+        if lock is None:
+            stub.MakeSyncCall(service, call, request, response)
+            return
+        lock.acquire()
+        try:
+            stub.MakeSyncCall(service, call, request, response)
+        finally:
+            lock.release()
+            
+class APIRequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = receive_message(self.request)
+            except (EOFError, socket.error):
+                return
+                
+            service, call, request_class, data, response_class = message
+            try:
+                request = load_class(request_class)()
+                request.ParseFromString(data)
+                response = load_class(response_class)()
+                self.server.call(service, call, request, response)
+                reply = ("ok", response.Encode())
+            except Exception, e:
+                reply = ("raise", e)
+                
+            try:
+                send_message(self.request, reply)
+            except pickle.PicklingError:
+                send_message(self.request, 
+                    ("raise", RuntimeError(repr(reply[1]))))
+                
+
+class APIProxyClient(object):
+    """
+    Stands in for the stubs of every service in a worker, and forwards API
+    calls to the server process, see APIServer
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        
+    def connection(self):
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self.local.sock = sock
+        return sock
+        
+    def MakeSyncCall(self, service, call, request, response):
+        message = (service, call, class_path(request), request.Encode(), 
+            class_path(response))
+        sock = self.connection()
+        try:
+            send_message(sock, message)
+            kind, value = receive_message(sock)
+        except (EOFError, socket.error):
+            sock.close()
+            self.local.sock = None
+            raise
+            
+        if kind == "raise":
+            raise value
+        response.ParseFromString(value)
+        
+    def install(self):
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
+        for service in SERVICES:
+            apiproxy_stub_map.apiproxy.RegisterStub(service, self)
+            
+            
+def install_stubs(app_id, datastore_path):
+    """Registers the SDK stubs of every service, in the server process"""
+    from google.appengine.api import apiproxy_stub_map
+    from google.appengine.api import urlfetch_stub
+    from google.appengine.api import user_service_stub
+    from google.appengine.api.memcache import memcache_stub
+    try:
+        from google.appengine.api.taskqueue import taskqueue_stub
+    except ImportError:
+        from google.appengine.api.labs.taskqueue import taskqueue_stub
+        
+    os.environ["APPLICATION_ID"] = app_id
+    apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
+    register = apiproxy_stub_map.apiproxy.RegisterStub
+    
+    # The file stub keeps every entity in memory and is not thread safe
+    try:
+        from google.appengine.datastore import datastore_sqlite_stub
+    except ImportError:
+        sys.exit("This App Engine SDK has no SQLite datastore stub, "
+            "please upgrade it")
+            
+    register("datastore_v3", datastore_sqlite_stub.DatastoreSqliteStub(
+        app_id, datastore_path))
+    register("memcache", memcache_stub.MemcacheServiceStub())
+    register("taskqueue", taskqueue_stub.TaskQueueServiceStub(root_path=ROOT))
+    register("user", user_service_stub.UserServiceStub())
+    register("urlfetch", urlfetch_stub.URLFetchServiceStub())
+    
+    
+class TaskRunner(threading.Thread):
+    """
+    Posts the tasks queued in the task queue stub to the workers, and 
+    deletes them once they succeeded. Failed tasks are retried at the next
+    check. Countdowns and ETAs are not honored.
+    """
+    
+    def __init__(self, lock, host, port, secret):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.lock = lock
+        self.host = host
+        self.port = port
+        self.secret = secret
+        
+    def stub(self):
+        from google.appengine.api import apiproxy_stub_map
+        return apiproxy_stub_map.apiproxy.GetStub("taskqueue")
+        
+    def queued(self):
+        """Returns (queue name, task) for each queued task"""
+        stub = self.stub()
+        self.lock.acquire()
+        try:
+            names = ["default"]
+            if hasattr(stub, "GetQueues"):
+                names = [q["name"] for q in stub.GetQueues()]
+            tasks = []
+            for name in names:
+                tasks.extend([(name, task) for task in stub.GetTasks(name)])
+            return tasks
+        finally:
+            self.lock.release()
+            
+    def post(self, queue, task):
+        headers = dict(task.get("headers", []))
+        headers["X-AppEngine-QueueName"] = queue
+        headers["X-AppEngine-TaskName"] = task["name"]
+        headers[TASK_HEADER] = self.secret
+        
+        connection = httplib.HTTPConnection(self.host, self.port)
+        try:
+            connection.request(task.get("method", "POST"), task["url"], 
+                base64.b64decode(task.get("body", "")), headers)
+            status = connection.getresponse().status
+        finally:
+            connection.close()
+        return 200 <= status < 300
+        
+    def run(self):
+        while True:
+            time.sleep(TASK_INTERVAL)
+            try:
+                for queue, task in self.queued():
+                    if self.post(queue, task):
+                        self.lock.acquire()
+                        try:
+                            self.stub().DeleteTask(queue, task["name"])
+                        finally:
+                            self.lock.release()
+                    else:
+                        logging.warning("Task %s failed, will retry", 
+                            task["name"])
+            except Exception:
+                logging.exception("Running tasks failed")
+                
+
+class RequestEnviron(UserDict.DictMixin):
+    """
+    Replaces os.environ in worker processes. The App Engine APIs read the
+    request (e.g. the signed in user) from os.environ, which threads share,
+    so each thread sees the variables of the request it serves on top of
+    those of the process.
+    """
+    
+    def __init__(self, base):
+        self.base = base
+        self.local = threading.local()
+        
+    def request(self):
+        return getattr(self.local, "request", None)
+        
+    def set_request(self, variables):
+        self.local.request = variables
+        
+    def __getitem__(self, name):
+        request = self.request()
+        if request is not None and name in request:
+            return request[name]
+        return self.base[name]
+        
+    def __setitem__(self, name, value):
+        request = self.request()
+        if request is not None:
+            request[name] = value
+        else:
+            self.base[name] = value
+            
+    def __delitem__(self, name):
+        request = self.request()
+        if request is not None and name in request:
+            del request[name]
+        else:
+            del self.base[name]
+            
+    def keys(self):
+        names = set(self.base.keys())
+        request = self.request()
+        if request is not None:
+            names.update(request.keys())
+        return list(names)
+        
+    def __contains__(self, name):
+        request = self.request()
+        return (request is not None and name in request) or name in self.base
+        
+    def copy(self):
+        return dict(self.items())
+        
+
+class URLHandlers(object):
+    """The handlers of app.yaml: static directories and files, and scripts"""
+    
+    def __init__(self, handlers):
+        self.handlers = []
+        for handler in handlers:
+            url = handler["url"]
+            if "static_dir" in handler:
+                regexp = "^" + url + "(/.*)?$"
+            else:
+                regexp = "^" + url + "$"
+            self.handlers.append((re.compile(regexp), handler))
+            
+    def find(self, path):
+        """Returns the handler of the given path and the file it maps to"""
+        for regexp, handler in self.handlers:
+            match = regexp.match(path)
+            if not match:
+                continue
+            if "static_dir" in handler:
+                return handler, os.path.join(handler["static_dir"], 
+                    (match.group(1) or "/").lstrip("/"))
+            if "static_files" in handler:
+                return handler, match.expand(handler["static_files"])
+            return handler, None
+        return None, None
+        
+
+class Connection(object):
+    """
+    A client connection of a worker. Its files are kept between requests,
+    as the read buffer may hold the next request.
+    """
+    
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.rfile = sock.makefile("rb", -1)
+        self.wfile = sock.makefile("wb", 0)
+        self.used = time.time()
+        self.closed = False
+        
+    def fileno(self):
+        return self.sock.fileno()
+        
+    def buffered(self):
+        """Whether a pipelined request was already read from the socket"""
+        buffer = self.rfile._rbuf
+        if isinstance(buffer, str):
+            return bool(buffer)
+        # Python 2.6 and later buffer reads in a StringIO
+        return buffer.tell() > 0
+        
+    def close(self):
+        self.closed = True
+        for f in (self.rfile, self.wfile, self.sock):
+            try:
+                f.close()
+            except socket.error:
+                pass
+                
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the requests a Connection has received. Requests sent after 
+    those are served once the worker polls the connection again.
+    """
+    
+    protocol_version = "HTTP/1.1"
+    server_version = "Stashboard"
+    
+    def setup(self):
+        self.connection = self.request.sock
+        self.rfile = self.request.rfile
+        self.wfile = self.request.wfile
+        
+    def handle(self):
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection and self.request.buffered():
+            self.handle_one_request()
+            
+    def finish(self):
+        if self.close_connection:
+            self.request.close()
+            
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline()
+        except (socket.timeout, socket.error):
+            self.close_connection = 1
+            return
+        if not self.raw_requestline:
+            self.close_connection = 1
+            return
+        if not self.parse_request():
+            return
+            
+        if self.server.stopping:
+            self.close_connection = 1
+        try:
+            self.serve()
+        except socket.error:
+            self.close_connection = 1
+            
+    def log_message(self, format, *args):
+        logging.debug("%s %s", self.client_address[0], format % args)
+        
+    def environ(self):
+        path, query = (self.path.split("?", 1) + [""])[:2]
+        environ = {
+            "REQUEST_METHOD": self.command,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": urllib.unquote(path),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.server.host,
+            "SERVER_PORT": str(self.server.port),
+            "SERVER_PROTOCOL": self.request_version,
+            "REMOTE_ADDR": self.client_address[0],
+            "CONTENT_TYPE": self.headers.get("content-type", ""),
+            "CONTENT_LENGTH": self.headers.get("content-length", ""),
+        }
+        
+        for name in self.headers.keys():
+            key = "HTTP_" + name.upper().replace("-", "_")
+            if key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+                environ[key] = ",".join(self.headers.getheaders(name))
+                
+        length = int(environ["CONTENT_LENGTH"] or 0)
+        body = length and self.rfile.read(length) or ""
+        
+        import cStringIO
+        environ.update({
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": environ.get("HTTP_X_FORWARDED_PROTO", "http"),
+            "wsgi.input": cStringIO.StringIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": self.server.threads > 1,
+            "wsgi.multiprocess": self.server.processes > 1,
+            "wsgi.run_once": False,
+        })
+        if environ["wsgi.url_scheme"] == "https":
+            environ["HTTPS"] = "on"
+        return environ
+        
+    def authenticate(self, environ):
+        """Sets the App Engine user variables of the environ"""
+        is_task = environ.pop("HTTP_" + TASK_HEADER.upper().replace("-", "_"), 
+            None) == self.server.task_secret
+        if not is_task:
+            for key in environ.keys():
+                if key.startswith("HTTP_X_APPENGINE_"):
+                    del environ[key]
+                    
+        email = ""
+        if self.server.user_header:
+            email = environ.get(self.server.user_header, "")
+        environ["AUTH_DOMAIN"] = "gmail.com"
+        environ["USER_EMAIL"] = email
+        environ["USER_ID"] = email
+        environ["USER_IS_ADMIN"] = str(int(is_task or 
+            email in self.server.admins))
+        
+    def serve(self):
+        environ = self.environ()
+        self.authenticate(environ)
+        
+        handler, path = self.server.url_handlers.find(environ["PATH_INFO"])
+        if handler is None:
+            self.respond("404 Not Found", [], "")
+        elif handler.get("login") == "admin" and \
+            environ["USER_IS_ADMIN"] != "1":
+            self.respond("403 Forbidden", [], "")
+        elif handler.get("login") == "required" and not environ["USER_EMAIL"]:
+            self.respond("403 Forbidden", [], "")
+        elif path is not None:
+            self.serve_file(path)
+        else:
+            self.serve_application(environ)
+            
+    def serve_file(self, path):
+        path = os.path.normpath(os.path.join(ROOT, path))
+        if not path.startswith(ROOT + os.sep) or not os.path.isfile(path):
+            self.respond("404 Not Found", [], "")
+            return
+            
+        f = open(path, "rb")
+        try:
+            body = f.read()
+        finally:
+            f.close()
+        content_type = mimetypes.guess_type(path)[0]
+        self.respond("200 OK", [("Content-Type", 
+            content_type or "application/octet-stream")], body)
+            
+    def serve_application(self, environ):
+        started = []
+        body = []
+        
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            started[:] = [status, headers]
+            return body.append
+            
+        self.server.environ.set_request(dict([(k, v) for k, v in 
+            environ.items() if isinstance(v, str)]))
+        try:
+            try:
+                result = self.server.application(environ, start_response)
+                try:
+                    for chunk in result:
+                        body.append(chunk)
+                finally:
+                    if hasattr(result, "close"):
+                        result.close()
+            except Exception:
+                logging.error("Serving %s failed\n%s", environ["PATH_INFO"],
+                    traceback.format_exc())
+                started[:] = ["500 Internal Server Error", []]
+                body = []
+        finally:
+            self.server.environ.set_request(None)
+            
+        if not started:
+            started[:] = ["500 Internal Server Error", []]
+        self.respond(started[0], started[1], "".join(body))
+        
+    def respond(self, status, headers, body):
+        code, reason = (status.split(" ", 1) + [""])[:2]
+        self.send_response(int(code), reason)
+        for name, value in headers:
+            if name.lower() not in ("content-length", "connection"):
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        self.wfile.flush()
+        
+
+class Worker(object):
+    """
+    A worker process. Its main thread polls the listening socket, shared
+    with the other workers, and the idle connections, and hands the
+    connections with a request to its threads, which serve them with a
+    RequestHandler and give them back.
+    """
+    
+    def __init__(self, options, app_yaml):
+        self.host = options.host
+        self.port = options.port
+        self.threads = options.threads
+        self.processes = options.processes
+        self.keep_alive = options.keep_alive
+        self.admins = set(options.admin)
+        self.user_header = None
+        if options.user_header:
+            self.user_header = "HTTP_" + \
+                options.user_header.upper().replace("-", "_")
+        self.task_secret = os.environ.pop(TASK_SECRET_VARIABLE)
+        self.url_handlers = URLHandlers(app_yaml["handlers"])
+        mimetypes.init()
+        self.stopping = False
+        
+        self.listener = socket.fromfd(options.listener, socket.AF_INET, 
+            socket.SOCK_STREAM)
+        self.listener.setblocking(0)
+        
+        # Connections to serve, and connections served, which the threads
+        # signal by writing to the wake pipe
+        self.requests = Queue.Queue()
+        self.served = Queue.Queue()
+        self.wake_read, self.wake_write = os.pipe()
+        
+        self.environ = RequestEnviron(os.environ)
+        os.environ = self.environ
+        
+        import main
+        self.application = main.wsgi_app
+        
+    def stop(self, *args):
+        self.stopping = True
+        
+    def accept(self):
+        """Returns the next connection, or None if another worker took it"""
+        try:
+            sock, address = self.listener.accept()
+        except socket.error, e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, 
+                errno.EINTR, errno.ECONNABORTED):
+                raise
+            return None
+        sock.setblocking(1)
+        sock.settimeout(self.keep_alive)
+        return Connection(sock, address)
+        
+    def serve(self):
+        while True:
+            connection = self.requests.get()
+            if connection is None:
+                return
+            try:
+                RequestHandler(connection, connection.address, self)
+            except Exception:
+                logging.exception("Serving %s failed", connection.address[0])
+                connection.close()
+            connection.used = time.time()
+            self.served.put(connection)
+            os.write(self.wake_write, "x")
+            
+    def poll(self):
+        """Polls the connections until stopping and all requests are served"""
+        poller = select.poll()
+        poller.register(self.listener, select.POLLIN)
+        poller.register(self.wake_read, select.POLLIN)
+        idle = {}
+        serving = 0
+        listening = True
+        parent = os.getppid()
+        
+        while listening or serving:
+            # Stop with the server process
+            if os.getppid() != parent:
+                self.stop()
+            if listening and self.stopping:
+                listening = False
+                poller.unregister(self.listener)
+                for fd, connection in idle.items():
+                    poller.unregister(fd)
+                    connection.close()
+                idle.clear()
+                
+            try:
+                events = poller.poll(POLL_INTERVAL * 1000)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+                
+            for fd, event in events:
+                if fd == self.wake_read:
+                    os.read(self.wake_read, 4096)
+                    while True:
+                        try:
+                            connection = self.served.get_nowait()
+                        except Queue.Empty:
+                            break
+                        serving -= 1
+                        if connection.closed:
+                            continue
+                        if not listening:
+                            connection.close()
+                            continue
+                        idle[connection.fileno()] = connection
+                        poller.register(connection, select.POLLIN)
+                elif fd in idle:
+                    # A request, or the client closed the connection
+                    poller.unregister(fd)
+                    serving += 1
+                    self.requests.put(idle.pop(fd))
+                elif listening and fd == self.listener.fileno():
+                    connection = self.accept()
+                    if connection is not None:
+                        idle[connection.fileno()] = connection
+                        poller.register(connection, select.POLLIN)
+                        
+            expired = time.time() - self.keep_alive
+            for fd, connection in idle.items():
+                if connection.used < expired:
+                    poller.unregister(fd)
+                    del idle[fd]
+                    connection.close()
+                    
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        
+        threads = [threading.Thread(target=self.serve) 
+            for i in range(self.threads)]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+            
+        self.poll()
+        for thread in threads:
+            self.requests.put(None)
+        for thread in threads:
+            thread.join()
+            
+
+class Server(object):
+    """
+    The server process: owns the API stubs, runs tasks, and starts, stops
+    and reloads the workers
+    """
+    
+    def __init__(self, options, argv):
+        self.options = options
+        self.argv = argv
+        self.workers = []
+        self.retiring = []
+        self.reloading = False
+        self.stopping = False
+        
+    def start_worker(self):
+        env = dict(os.environ)
+        env[TASK_SECRET_VARIABLE] = self.task_secret
+        argv = [sys.executable, os.path.abspath(__file__)] + self.argv + [
+            "--worker", "--listener", str(self.listener.fileno()),
+            "--api-socket", self.api_path]
+        return subprocess.Popen(argv, env=env, close_fds=False)
+        
+    def reload(self, *args):
+        self.reloading = True
+        
+    def stop(self, *args):
+        self.stopping = True
+        
+    def run(self):
+        options = self.options
+        app_id = options.app_id or read_app_yaml()["application"]
+        install_stubs(app_id, options.datastore)
+        
+        self.task_secret = base64.b64encode(os.urandom(24))
+        locks = dict([(service, threading.Lock()) 
+            for service in LOCKED_SERVICES])
+        
+        self.api_path = options.api_socket
+        if not self.api_path:
+            self.api_path = os.path.join(tempfile.mkdtemp(), "api.sock")
+        if os.path.exists(self.api_path):
+            os.unlink(self.api_path)
+        api_server = APIServer(self.api_path, locks)
+        api_thread = threading.Thread(target=api_server.serve_forever)
+        api_thread.setDaemon(True)
+        api_thread.start()
+        
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((options.host, options.port))
+        self.listener.listen(128)
+        
+        host = options.host
+        if host in ("", "0.0.0.0"):
+            host = "127.0.0.1"
+        TaskRunner(locks["taskqueue"], host, options.port, 
+            self.task_secret).start()
+        
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        
+        logging.info("Serving on %s:%d with %d processes of %d threads", 
+            options.host, options.port, options.processes, options.threads)
+        self.workers = [self.start_worker() for i in range(options.processes)]
+        
+        while not self.stopping:
+            time.sleep(SUPERVISE_INTERVAL)
+            
+            if self.reloading:
+                logging.info("Reloading")
+                self.reloading = False
+                self.retire(self.workers)
+                self.workers = [self.start_worker() 
+                    for i in range(options.processes)]
+                    
+            for i, worker in enumerate(self.workers):
+                if worker.poll() is not None and not self.stopping:
+                    logging.error("Worker %d exited with %s, restarting", 
+                        worker.pid, worker.returncode)
+                    self.workers[i] = self.start_worker()
+                    
+            self.retiring = [w for w in self.retiring if w.poll() is None]
+            
+        logging.info("Stopping")
+        self.retire(self.workers)
+        while [w for w in self.retiring if w.poll() is None]:
+            time.sleep(0.1)
+        api_server.server_close()
+        os.unlink(self.api_path)
+        
+    def retire(self, workers):
+        """Asks the given workers to finish their requests and exit"""
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        self.retiring.extend(workers)
+        
+        
+def run_cgi(options):
+    """Runs main.py as a CGI script, with the API of a running server"""
+    os.environ.setdefault("APPLICATION_ID", 
+        options.app_id or read_app_yaml()["application"])
+    APIProxyClient(options.api_socket).install()
+    import main
+    main.main()
+    
+def main(argv):
+    options = parse_options(argv)
+    add_sdk_to_path(options.sdk)
+    logging.getLogger().setLevel(logging.INFO)
+    
+    if options.cgi:
+        run_cgi(options)
+        return
+        
+    if not options.worker:
+        # Workers get the same options
+        Server(options, argv).run()
+        return
+        
+    app_yaml = read_app_yaml()
+    os.environ.update({
+        "APPLICATION_ID": options.app_id or app_yaml["application"],
+        "CURRENT_VERSION_ID": "%s.1" % app_yaml["version"],
+        "SERVER_SOFTWARE": "Stashboard Server",
+        "AUTH_DOMAIN": "gmail.com",
+    })
+    APIProxyClient(options.api_socket).install()
+    Worker(options, app_yaml).run()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
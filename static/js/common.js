@@ -246,23 +246,24 @@ stashboard.fillLegend = function(isAdmin) {
 };
 
 stashboard.fillIndex = function() {
-    var currentNow = new Date();
-    var d = new Date(currentNow.getTime() - 86400000);
     var thead = $("#service-list thead tr");
+    var days = [];
+
+    // Days come back from the dashboard as YYYY-MM-DD strings
+    var splitDay = function(day) {
+        var parts = day.split("-");
+        return {
+            year: parseInt(parts[0], 10),
+            month: parseInt(parts[1], 10),
+            date: parseInt(parts[2], 10)
+        };
+    };
 
-    for (var i=0; i < 5; i++) {
-        $("<th />", {
-            "class": "date",
-            text: (d.getMonth() + 1) + "/" + d.getDate() + "/" + d.getFullYear()
-        }).appendTo(thead);
-        d = new Date(d.getTime() - 86400000);
-    }
-
-    var createServiceRow = function(data, fetchStatuses){
-        var informationImage = "/images/status/question-white.png";
+    var createServiceRow = function(data){
         var defaultImage = "/images/status/tick-circle.png";
         var imageRow = defaultImage;
         var tr = $('<tr />', {id: data.id});
+        var evt = data["current-event"];
 
         $('<td />').append(
             $('<a />', {
@@ -271,131 +272,84 @@ stashboard.fillIndex = function() {
             })
         ).appendTo(tr);
 
-        if (fetchStatuses) {
-            imageRow = informationImage;
+        // Services added from the dialog come without days or an event
+        if (evt) {
+            imageRow = evt.status.image;
         }
         
-        $('<td />', {"class": "status highlight"}).append(
-            $('<a />', {
-                href: 'services/' + data.id,
-                html: $("<img />", {
-                    src: imageRow,
-                    alt: "Unknown Status"
-                })
+        var current = $('<a />', {
+            href: 'services/' + data.id,
+            html: $("<img />", {
+                src: imageRow,
+                alt: "Unknown Status"
             })
-        ).appendTo(tr);
+        });
 
-        for (var i=0; i < 5; i++) {
-            $("<td />", {"class": "status"}).append(
+        if (evt && evt.informational) {
+            current.append(
                 $("<img />", {
-                    src: imageRow,
-                    alt: "Unknown Status"
+                    src: "/images/small-information.png", 
+                    "class": "information"
                 })
-            ).appendTo(tr);
+            );
         }
 
-        $("#service-list").fadeIn('fast', function(){    
-            $("#services-body").append(tr);
-        });
-
-        if (fetchStatuses){
-
-            $.ajax({ 
-                type: "GET",
-                url: "/api/v1/services/" + data.id + "/events/current",
-                dataType: 'json', 
-                success: function(evt){ 
-                    $("#" + data.id + " td.highlight img")
-                        .attr("src", evt.status.image);
-
-                    if (evt.informational) {
-                        $("#" + data.id + " td.highlight a").append(
-                            $("<img />", {
-                                src: "/images/small-information.png", 
-                                "class": "information"
-                            })
-                        );
-                    }
-                },
-                error: function(evt){ 
-                    $("#" + data.id + " td.highlight img")
-                        .attr("src", defaultImage);
-                }
-            });
+        $('<td />', {"class": "status highlight"}).append(current).appendTo(tr);
 
-            var rightNow = new Date();
-            rightNow.setHours(0);
-            rightNow.setMinutes(0);
-	    rightNow.setSeconds(0);
-            rightNow.setMilliseconds(0);
-
-            var endDate = new Date(rightNow.getTime());
-            var startDate = new Date(endDate.getTime() - 86400000 * 5);
-            var url = "/api/v1/services/" + data.id + "/events";
-            url += "?start=" + stashboard.rfc1123(startDate);
-            url += "&end=" + stashboard.rfc1123(endDate);
-
-            $.ajax({ 
-                type: "GET",
-                url: url,
-                dataType: 'json', 
-                success: function(results){ 
-                    var calendar = {};
-                    var days = [];
-
-		    // Make end date the correct date
-		    endDate = new Date(endDate.getTime() - 86400000);
-
-                    for (var i=0; i < 5; i++) {
-                        days.push(endDate);
-                        calendar[endDate.getDate()] = false;
-                        endDate = new Date(endDate.getTime() - 86400000);
-                    }
-
-                    var events = results.events;
+        for (var i=0; i < days.length; i++) {
+            var td = $("<td />", {"class": "status"});
 
-                    for (i=0; i < events.length; i++) {
-                        var e = events[i];
-                        var evtDate = new Date(e.timestamp);
-                        calendar[evtDate.getDate()] = e.informational || e.status.level !== "NORMAL";
-                    }
+            if (data.days) {
+                var summary = data.days[i];
+                var d = splitDay(summary.day);
+                var url = "/services/" + data.id + "/" + d.year + "/";
+                url += d.month + "/" + d.date;
+                var image = defaultImage;
 
-                    for (i= days.length-1; i >= 0; i--) {
-                        var d = days[i];
-                        var td = $("#" + data.id).children("td").eq(i+2);
-
-                        url = "/services/" + data.id + "/" + d.getFullYear() + "/";
-                        url += (d.getMonth() + 1) + "/" + d.getDate();
-
-                        if (calendar[d.getDate()]) {
-                            td.html($("<a />", {href: url}).append(
-                                $("<img />",{src: "/images/status/information.png"}))
-                            );
-                        } else {
-                            td.html($("<a />", {href: url}).append(
-                                $("<img />",{src: defaultImage}))
-                            );
-                        }
-                    }
+                if (summary.informational || summary.level !== "NORMAL") {
+                    image = "/images/status/information.png";
+                }
 
-                },
-                error: function(){ 
+                td.html($("<a />", {href: url}).append(
+                    $("<img />", {src: image}))
+                );
+            } else {
+                td.append(
+                    $("<img />", {
+                        src: defaultImage,
+                        alt: "Unknown Status"
+                    })
+                );
+            }
 
-                }
-            });
+            td.appendTo(tr);
         }
+
+        $("#service-list").fadeIn('fast', function(){    
+            $("#services-body").append(tr);
+        });
     };
 
     $.ajax({ 
         type: "GET",
-        url: "/api/v1/services",
+        url: "/api/v1/dashboard",
         dataType: 'json', 
         success: function(data){ 
 
+            days = data.days;
+
+            for (var i=0; i < days.length; i++) {
+                var d = splitDay(days[i]);
+                $("<th />", {
+                    "class": "date",
+                    text: d.month + "/" + d.date + "/" + d.year
+                }).appendTo(thead);
+            }
+
             var services = data.services;
 
-            for (var i=0; i < services.length; i++) {
-                createServiceRow(services[i], true);
+            for (i=0; i < services.length; i++) {
+                createServiceRow(services[i]);
             }
 
         },
@@ -442,7 +396,7 @@ stashboard.fillIndex = function() {
                     context: $("#service-list"), 
                     success: function(data){ 
                         $("#add-service-modal").dialog('close');
-                        createServiceRow(data, false);
+                        createServiceRow(data);
                     },
                     error: function(evt){ 
                         $("#add-service-modal").dialog('close');
@@ -570,30 +524,44 @@ stashboard.fillService = function(serviceName, isAdmin, start_date, end_date) {
                 eventsURL += "&end=" + end;
             }
 
-            $.ajax({ 
-                type: "GET",
-                url: eventsURL,
-                dataType: "json",
-                context: $(".event-log").children('tbody'), 
-                success: function(data){
+            // Events come back a page at a time, follow the next links
+            var loadEvents = function(url, first) {
+                $.ajax({ 
+                    type: "GET",
+                    url: url,
+                    dataType: "json",
+                    context: $(".event-log").children('tbody'), 
+                    success: function(data){
 
-                    var events = data.events;
-                    var length = events.length;
+                        var events = data.events;
+                        var length = events.length;
+
+                        if (first) {
+                            if (length > 0) {
+                                populatStatuses(events[0].status.name);
+                            } else {
+                                populatStatuses();
+                            }
+                        }
 
-                    if (length > 0) {
-                        populatStatuses(events[0].status.name);
                         for (var i=0; i < length; i++) {
                             var tr = createRow(events[i]);
                             $(this).append(tr);  
                         }
-                    } else {
-                        populatStatuses();
+
+                        if (data.next) {
+                            loadEvents(data.next, false);
+                        }
+                    },
+                    error: function(){
+                        if (first) {
+                            populatStatuses();
+                        }
                     }
-                },
-                error: function(){
-                    populatStatuses();
-                }
-            });
+                });
+            };
+
+            loadEvents(eventsURL, true);
 
             $("#delete-service").click(function(event){
                 $("#delete-service-modal").dialog({
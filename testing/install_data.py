@@ -18,21 +18,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from google.appengine.ext import db
 from models import Status, Service, Event
+from utils import versions
 from datetime import datetime, timedelta, date
 
-#foo = Service(name="Service Foo", slug="service-foo",
-#              description="Scalable and reliable foo service across the globe")
-#foo.put()
-#bar = Service(name="Service Bar", slug="service-bar",
-              description="Scalable and reliable foo service")
-#bar.put()
-#delete = Service(name="Delete Me", slug="delete", 
-                 description="Delete Me Please")
-#delete.put()
+def install_service(name, slug, description):
+    service = Service.get_by_slug(slug)
+    if service is None:
+        service = Service.create(slug, name, description)
+        service.put()
+    return service
+
+foo = install_service("Service Foo", "service-foo",
+                      "Scalable and reliable foo service across the globe")
+bar = install_service("Service Bar", "service-bar",
+                      "Scalable and reliable foo service")
+delete = install_service("Delete Me", "delete", "Delete Me Please")
 
-bar = Service.get_by_slug("bar")
 cat = Status.get_by_slug("down")        
 
 dates = [
@@ -43,9 +45,13 @@ dates = [
     datetime(2010, 7, 18, 7),
 ]
 
+# Created like the API does, so the events show up in the service's history
+events = []
 for d in dates:
-    e = Event(service=bar, status=cat, 
+    e = Event(parent=bar, service=bar, status=cat, 
           message="Error fine", start=d)
-    e.put()
-
+    events.append(e)
 
+Service.events_added(events)
+versions.bump(versions.GLOBAL, versions.service(foo.slug), 
+              versions.service(bar.slug), versions.service(delete.slug))
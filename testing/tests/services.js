@@ -51,7 +51,7 @@ function testError(url, method, code, data){
 	data = data || {};
 	$.ajax({ 
 	    type: method,
-	    Url: url,
+	    url: url,
 	    Datatype: 'json', 
 	    data: data,
 	    success: function(service){ 
@@ -105,16 +105,17 @@ asyncTest("Getting a service succeeds", function() {
     });
 });
 
-asyncTest("Deleting a service succeeds", function() {
-    expect(3);
+asyncTest("Deleting a service starts a delete job", function() {
+    expect(4);
     $.ajax({ 
 	type: "DELETE",
 	url: "/api/v1/services/delete",
 	Datatype: 'json', 
-	success: function(service){ 
-	    equals("Delete Me",service.name);
-	    equals("Delete Me Please",service.description);
-	    equals("delete",service.id);
+	success: function(job, textStatus, xhr){ 
+	    equals(xhr.status, 202);
+	    equals("service",job.kind);
+	    equals("delete",job.target);
+	    ok(job.url, "Link to the job");
 	    start();
 	},
 	error: function(evt){ 
@@ -239,6 +240,9 @@ asyncTest("PUT /services should fail", function() {
     });
 });
 
+asyncTest("DELETE a non-existent status fails", 
+    testError("/api/v1/statuses/wrong-status", "DELETE", 404));
+
 module("Events");
 
 asyncTest("GET Test that the calendar resource respects timezone offset", 2, function(){
@@ -327,4 +331,434 @@ asyncTest("GET Test that the event resource filters properly", 1, function(){
 	    start();
 	}
     });    
-})
\ No newline at end of file
+})
+
+asyncTest("GET Test that the event resource pages with limit and cursor", 4, function(){
+    url = "/api/v1/services/service-bar/events?limit=2";
+
+    $.ajax({ 
+	type: "GET",
+	url: url,
+	dataType: 'json', 
+	success: function(page){ 
+	    equals(page.events.length, 2, "Two events returned");
+	    ok(page.next, "Link to the next page");
+
+	    $.ajax({ 
+		type: "GET",
+		url: page.next,
+		dataType: 'json', 
+		success: function(next){ 
+		    equals(next.events.length, 2, "Two more events returned");
+		    ok(next.events[0].sid != page.events[0].sid && 
+		       next.events[0].sid != page.events[1].sid,
+		       "The next page starts after the first");
+		    start();
+		},
+		error: function(evt){ 
+		    start();
+		}
+	    });
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET Test that the last page of events has no next link", 1, function(){
+    url = "/api/v1/services/service-bar/events?limit=1000";
+
+    $.ajax({ 
+	type: "GET",
+	url: url,
+	dataType: 'json', 
+	success: function(page){ 
+	    ok(!page.next, "No link to a next page");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET events with an invalid cursor fails", 
+    testError("/api/v1/services/service-bar/events?cursor=wrong", "GET", 400));
+
+asyncTest("GET events with an invalid limit fails", 
+    testError("/api/v1/services/service-bar/events?limit=many", "GET", 400));
+
+module("Dashboard");
+
+function dashboardService(data, slug){
+    for (var i = 0; i < data.services.length; i++) {
+	if (data.services[i].id == slug) {
+	    return data.services[i];
+	}
+    }
+    return null;
+}
+
+asyncTest("GET /dashboard summarizes the past days of each service", 7, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/dashboard",
+	dataType: 'json', 
+	success: function(data){ 
+	    equals(data.days.length, 5, "Five days by default");
+
+	    var bar = dashboardService(data, "service-bar");
+	    ok(bar, "Service listed");
+	    equals(bar.days.length, data.days.length, "One summary per day");
+	    equals(bar.days[0].day, data.days[0], "Summaries in the same order");
+	    equals(typeof bar.days[0].level, "string", "Day has a level");
+	    equals(typeof bar.days[0].informational, "boolean", 
+		   "Day has an informational flag");
+	    equals(typeof bar.days[0].events, "number", "Day has an event count");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /dashboard lists consecutive days, most recent first", 1, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/dashboard?days=2",
+	dataType: 'json', 
+	success: function(data){ 
+	    var first = new Date(data.days[0] + "T00:00:00Z");
+	    var second = new Date(data.days[1] + "T00:00:00Z");
+	    equals(first - second, 24 * 60 * 60 * 1000, "Days are consecutive");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /dashboard with too few days returns one", 1, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/dashboard?days=0",
+	dataType: 'json', 
+	success: function(data){ 
+	    equals(data.days.length, 1);
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /dashboard with too many days returns a month", 2, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/dashboard?days=1000",
+	dataType: 'json', 
+	success: function(data){ 
+	    equals(data.days.length, 31);
+	    equals(dashboardService(data, "service-bar").days.length, 31);
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /dashboard with an invalid number of days fails", 
+    testError("/api/v1/dashboard?days=many", "GET", 400));
+
+module("Conditional requests");
+
+function testConditional(url, header, value, status){
+    return function() {
+	expect(2);
+	$.ajax({ 
+	    type: "GET",
+	    url: url,
+	    complete: function(first){ 
+		var validator = first.getResponseHeader(value);
+		ok(validator, value + " header sent");
+
+		$.ajax({ 
+		    type: "GET",
+		    url: url,
+		    beforeSend: function(xhr){
+			xhr.setRequestHeader(header, 
+			    status == 304 ? validator : '"stale"');
+		    },
+		    complete: function(second){ 
+			equals(second.status, status);
+			start();
+		    }
+		});
+	    }
+	});
+    }
+}
+
+asyncTest("GET with a matching If-None-Match is not modified", 
+    testConditional("/api/v1/services/service-foo", "If-None-Match", 
+		    "ETag", 304));
+
+asyncTest("GET with a stale If-None-Match returns the resource", 
+    testConditional("/api/v1/services/service-foo", "If-None-Match", 
+		    "ETag", 200));
+
+asyncTest("GET with a current If-Modified-Since is not modified", 
+    testConditional("/api/v1/services/service-foo/events", 
+		    "If-Modified-Since", "Last-Modified", 304));
+
+module("Bulk events");
+
+asyncTest("POST /events returns a result per record", 6, function(){
+    var records = [
+	{"service": "service-foo", "status": "up", "message": "Bulk event"},
+	{"service": "missing-service", "message": "Bulk event"},
+	{"service": ["service-foo"], "message": "Bulk event"},
+	{"service": "service-foo"},
+	"Bad Data"
+    ];
+
+    $.ajax({ 
+	type: "POST",
+	url: "/api/v1/events",
+	contentType: "application/json",
+	processData: false,
+	data: JSON.stringify(records),
+	dataType: 'json', 
+	success: function(data){ 
+	    equals(data.events.length, 5, "One result per record");
+	    equals(data.events[0].message, "Bulk event", "Event added");
+	    equals(data.events[1].code, 404, "Missing service");
+	    equals(data.events[2].code, 400, "Service is not a slug");
+	    equals(data.events[3].code, 400, "Message is required");
+	    equals(data.events[4].code, 400, "Record is not an object");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("POST /events without a JSON list fails", 
+    testError("/api/v1/events", "POST", 400, {"events": "{}"}));
+
+asyncTest("GET /services/<slug>/events is not the bulk resource", 1, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/services/service-bar/events",
+	dataType: 'json', 
+	success: function(data){ 
+	    ok(data.events, "Events of the service listed");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+module("Sync");
+
+function sync(body, success){
+    $.ajax({ 
+	type: "POST",
+	url: "/api/v1/sync",
+	contentType: "application/json",
+	processData: false,
+	data: JSON.stringify(body),
+	dataType: 'json', 
+	success: success,
+	error: function(evt){ 
+	    start();
+	}
+    });
+}
+
+asyncTest("POST /sync creates, then leaves alone, then updates", 4, function(){
+    var name = "Sync Test " + new Date().getTime();
+    var definition = {"name": name, "description": "Synchronized"};
+
+    sync({"services": [definition]}, function(first){
+	equals(first.services[0].result, "created");
+	equals(first.services[0].name, name);
+
+	sync({"services": [definition]}, function(second){
+	    equals(second.services[0].result, "unchanged");
+	    definition.description = "Synchronized again";
+
+	    sync({"services": [definition]}, function(third){
+		equals(third.services[0].result, "updated");
+		start();
+	    });
+	});
+    });
+});
+
+asyncTest("POST /sync reports absent services", 3, function(){
+    var foo = {
+	"name": "Service Foo", 
+	"description": "Scalable and reliable foo service across the globe"
+    };
+
+    sync({"services": [foo], "absent": "report"}, function(data){
+	equals(data.services[0].result, "unchanged");
+	ok($.inArray("service-bar", data.absent) >= 0, "Missing service listed");
+	ok($.inArray("service-foo", data.absent) < 0, "Synced service not listed");
+	start();
+    });
+});
+
+asyncTest("POST /sync only reports absent services when asked", 1, function(){
+    sync({"services": []}, function(data){
+	ok(!data.absent, "No absent services listed");
+	start();
+    });
+});
+
+asyncTest("POST /sync rejects definitions that aren't strings", 3, function(){
+    var body = {
+	"services": [{"name": ["Service Foo"], "description": "Listed"}],
+	"statuses": [{"name": "Sync Status", "description": "Listed", 
+		      "level": "NORMAL", "image": ["cross-circle"]},
+		     {"name": "Sync Status", "description": {}, 
+		      "level": "NORMAL", "image": "cross-circle"}]
+    };
+
+    sync(body, function(data){
+	equals(data.services[0].code, 400, "Name is not a string");
+	equals(data.statuses[0].code, 400, "Image is not a string");
+	equals(data.statuses[1].code, 400, "Description is not a string");
+	start();
+    });
+});
+
+asyncTest("POST /sync doesn't delete absent services after a bad definition", 
+	  3, function(){
+    var body = {
+	"services": [{"name": "Service Foo", "description": ""}],
+	"absent": "delete"
+    };
+
+    sync(body, function(data){
+	equals(data.services[0].code, 400, "Description is required");
+	ok($.inArray("service-foo", data.absent) < 0, 
+	   "Badly defined service not absent");
+	equals(data.jobs.length, 0, "No service deleted");
+	start();
+    });
+});
+
+asyncTest("POST /sync with an unknown absent mode fails", 
+    testError("/api/v1/sync", "POST", 400, 
+	      {"sync": '{"services": [], "absent": "keep"}'}));
+
+asyncTest("POST /sync reporting absent services without a list fails", 
+    testError("/api/v1/sync", "POST", 400, 
+	      {"sync": '{"statuses": [], "absent": "report"}'}));
+
+asyncTest("GET /services/sync is the service named sync", 
+    testError("/api/v1/services/sync", "GET", 404));
+
+module("Status images");
+
+asyncTest("GET /status-images without parameters lists every image", 3, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/status-images",
+	dataType: 'json', 
+	success: function(data){ 
+	    ok(data.images.length > 1000, "Every image listed");
+	    ok(data.images[0].name && data.images[0].url, "Image has a name and URL");
+	    ok(data.total === undefined && data.next === undefined, 
+	       "No paging information");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /status-images pages with limit and offset", 5, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/status-images?limit=2",
+	dataType: 'json', 
+	success: function(page){ 
+	    equals(page.images.length, 2, "Two images returned");
+	    ok(page.total > 2, "Total of every image");
+	    ok(page.next, "Link to the next page");
+
+	    $.ajax({ 
+		type: "GET",
+		url: page.next,
+		dataType: 'json', 
+		success: function(next){ 
+		    equals(next.images.length, 2, "Two more images returned");
+		    ok(next.images[0].name > page.images[1].name,
+		       "The next page starts after the first");
+		    start();
+		},
+		error: function(evt){ 
+		    start();
+		}
+	    });
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /status-images filters by prefix and substring", 3, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/status-images?prefix=address-book&q=arrow",
+	dataType: 'json', 
+	success: function(data){ 
+	    var matching = 0;
+	    $.each(data.images, function(i, image){
+		if (image.name.indexOf("address-book") == 0 && 
+		    image.name.indexOf("arrow") >= 0) {
+		    matching += 1;
+		}
+	    });
+	    ok(data.images.length > 0, "Images found");
+	    equals(matching, data.images.length, "Only matching images");
+	    equals(data.total, data.images.length, "Total of the matches");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /status-images on the last page has no next link", 2, function(){
+    $.ajax({ 
+	type: "GET",
+	url: "/api/v1/status-images?prefix=address-book&limit=1000",
+	dataType: 'json', 
+	success: function(data){ 
+	    equals(data.images.length, data.total, "Every match returned");
+	    ok(!data.next, "No link to a next page");
+	    start();
+	},
+	error: function(evt){ 
+	    start();
+	}
+    });    
+});
+
+asyncTest("GET /status-images with an invalid limit fails", 
+    testError("/api/v1/status-images?limit=many", "GET", 400));
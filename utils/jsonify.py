@@ -0,0 +1,58 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Fast JSON encoding for API responses, and decoding for requests
+
+The rest() methods of our models only produce dicts, lists, strings,
+numbers, booleans and None, so there is no need for a reflective pickler.
+We hand the data straight to the standard library json encoder (C
+accelerated from Python 2.7 on), falling back to simplejson on older
+runtimes.
+
+Responses used to be HTML escaped with cgi.escape after encoding. Outside
+of strings, JSON never contains &, < or >, so escaping only has to touch
+the output when one of those characters shows up at all. The result is
+byte for byte what jsonpickle.encode followed by cgi.escape produced.
+"""
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+_encoder = json.JSONEncoder()
+
+def encode(data):
+    """Return the HTML-safe JSON representation of data"""
+    s = _encoder.encode(data)
+    
+    if "&" in s:
+        s = s.replace("&", "&amp;")
+    if "<" in s:
+        s = s.replace("<", "&lt;")
+    if ">" in s:
+        s = s.replace(">", "&gt;")
+        
+    return s
+    
+def decode(s):
+    """Return the data represented by the JSON string s"""
+    return json.loads(s)
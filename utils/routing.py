@@ -0,0 +1,282 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Routing helpers
+
+Handlers are named in ROUTES by their dotted path, e.g. 
+"handlers.api.ServicesListHandler", and wrapped in a LazyHandler, so a
+handler module is only imported by the first request routed to it.
+
+Requests are dispatched by a Router, a trie of path segments, instead of
+trying the regexp of every route in turn. Routes are still given as 
+regexps and the first route matching a path still wins, but a capture 
+only matches a single segment: "/api/(.+)/events" doesn't match 
+"/api/v1/services/example/events". ROUTES in main.py is ordered so that
+no route is shadowed by an earlier one either way, so this changes none of
+its dispatches.
+"""
+
+import logging
+import re
+
+from google.appengine.ext import webapp
+
+# Segments of a route captured as an argument of its handler, with a check
+# on the value of the segment. Empty segments are never captured.
+CAPTURES = {
+    "(.+)": None,
+    r"(\d+)": lambda segment: segment.isdigit(),
+}
+
+# A route ending with this matches whatever follows, e.g. "/api/.*"
+REST = ".*"
+
+# Number of paths whose route a Router remembers, see Router.match
+MAX_CACHED_PATHS = 1000
+
+# Characters with a meaning in regexps, once escaped characters are removed
+SPECIAL = re.compile(r"[.^$*+?{}\[\]|()\\]")
+ESCAPED = re.compile(r"\\(.)")
+
+class LazyHandler(object):
+    """
+    Stands in for a request handler class in the routes given to 
+    webapp.WSGIApplication, which only ever calls it to make a handler.
+    The class is imported the first time that happens.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.module_name, self.__name__ = path.rsplit(".", 1)
+        self.handler_class = None
+        
+    def resolve(self):
+        """Return the handler class, importing its module if needed"""
+        if self.handler_class is None:
+            logging.debug("Importing %s", self.path)
+            module = __import__(self.module_name, {}, {}, [self.__name__])
+            self.handler_class = getattr(module, self.__name__)
+        return self.handler_class
+        
+    def __call__(self):
+        return self.resolve()()
+        
+def lazy_routes(routes):
+    """
+    Return the given (regexp, handler) routes with every handler given by
+    its dotted path wrapped in a LazyHandler. Handler classes are kept.
+    """
+    handlers = {}
+    lazy = []
+    for regexp, handler in routes:
+        if isinstance(handler, basestring):
+            if handler not in handlers:
+                handlers[handler] = LazyHandler(handler)
+            handler = handlers[handler]
+        lazy.append((regexp, handler))
+    return lazy
+
+def split_route(regexp):
+    """
+    Return the segments of the given route regexp: literal strings, 
+    captures (keys of CAPTURES) and REST last. Returns None for routes which
+    can't be split into segments.
+    """
+    if regexp.endswith("$") and not regexp.endswith("\\$"):
+        regexp = regexp[:-1]
+    if not regexp.startswith("/"):
+        return None
+        
+    segments = []
+    parts = regexp.split("/")[1:]
+    for i, part in enumerate(parts):
+        if part in CAPTURES:
+            segments.append(part)
+        elif part == REST and i == len(parts) - 1:
+            segments.append(REST)
+        elif SPECIAL.search(ESCAPED.sub("", part)):
+            return None
+        else:
+            segments.append(ESCAPED.sub(r"\1", part))
+    return segments
+    
+class Node(object):
+    """A segment of the routes in a Router"""
+    
+    def __init__(self):
+        self.literals = {}
+        self.captures = []
+        # (index, handler) of the first route ending here, and the first 
+        # route ending with REST here
+        self.route = None
+        self.rest = None
+        
+    def capture(self, pattern):
+        """Return the child node for the given capture pattern"""
+        for other, check, node in self.captures:
+            if other == pattern:
+                return node
+        node = Node()
+        self.captures.append((pattern, CAPTURES[pattern], node))
+        return node
+        
+class Router(object):
+    """
+    Finds the handler for a path, like webapp.WSGIApplication does with 
+    its list of (regexp, handler) routes.
+    
+    Routes which can be split into segments (see split_route) are stored 
+    in a trie, so finding one takes a dictionary lookup per segment of the
+    path. The others are kept as regexps, and only tried when they come 
+    before the route found in the trie.
+    
+    The routes of the last paths matched are remembered, up to cache_size
+    paths, since most requests are for a few paths.
+    """
+    
+    def __init__(self, routes, cache_size=MAX_CACHED_PATHS):
+        self.root = Node()
+        self.regexps = []
+        self.cache = {}
+        self.cache_size = cache_size
+        
+        for index, (regexp, handler) in enumerate(routes):
+            segments = split_route(regexp)
+            if segments is None:
+                if not regexp.startswith("^"):
+                    regexp = "^" + regexp
+                if not regexp.endswith("$"):
+                    regexp += "$"
+                self.regexps.append((index, re.compile(regexp), handler))
+                continue
+                
+            node = self.root
+            for segment in segments:
+                if segment == REST:
+                    if node.rest is None:
+                        node.rest = (index, handler)
+                    break
+                elif segment in CAPTURES:
+                    node = node.capture(segment)
+                else:
+                    node = node.literals.setdefault(segment, Node())
+            else:
+                if node.route is None:
+                    node.route = (index, handler)
+                    
+    def find(self, node, segments, i, captured):
+        """
+        Return (index, handler, arguments) for the first route in and below
+        node matching segments[i:], or None
+        """
+        if i == len(segments):
+            if node.route:
+                return node.route + (tuple(captured),)
+            return None
+            
+        found = None
+        segment = segments[i]
+        child = node.literals.get(segment)
+        if child:
+            found = self.find(child, segments, i + 1, captured)
+            
+        if segment:
+            for pattern, check, child in node.captures:
+                if check and not check(segment):
+                    continue
+                captured.append(segment)
+                match = self.find(child, segments, i + 1, captured)
+                captured.pop()
+                if match and (found is None or match[0] < found[0]):
+                    found = match
+                    
+        if node.rest and (found is None or node.rest[0] < found[0]):
+            found = node.rest + (tuple(captured),)
+        return found
+        
+    def match(self, path):
+        """
+        Return the handler of the first route matching the given path and 
+        the arguments captured from it, or (None, ())
+        """
+        result = self.cache.get(path)
+        if result is None:
+            result = self.route(path)
+            if self.cache_size:
+                if len(self.cache) >= self.cache_size:
+                    self.cache.clear()
+                self.cache[path] = result
+        return result
+        
+    def route(self, path):
+        """Like match, without the cache"""
+        found = None
+        if path.startswith("/"):
+            found = self.find(self.root, path.split("/")[1:], 0, [])
+            
+        for index, regexp, handler in self.regexps:
+            if found and index > found[0]:
+                break
+            match = regexp.match(path)
+            if match:
+                return handler, match.groups()
+                
+        if found:
+            return found[1], found[2]
+        return None, ()
+        
+class WSGIApplication(webapp.WSGIApplication):
+    """
+    A webapp.WSGIApplication finding handlers with a Router. Handlers are
+    called just like webapp calls them.
+    """
+    
+    METHODS = ("GET", "POST", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE")
+    
+    def __init__(self, url_mapping, debug=False):
+        webapp.WSGIApplication.__init__(self, url_mapping, debug)
+        self.router = Router(url_mapping)
+        self.debug = debug
+        
+    def __call__(self, environ, start_response):
+        request = self.REQUEST_CLASS(environ)
+        response = self.RESPONSE_CLASS()
+        webapp.WSGIApplication.active_instance = self
+        
+        handler_class, groups = self.router.match(request.path)
+        self.current_request_args = groups
+        
+        if handler_class:
+            handler = handler_class()
+            handler.initialize(request, response)
+            method = environ["REQUEST_METHOD"]
+            try:
+                if method in self.METHODS:
+                    getattr(handler, method.lower())(*groups)
+                else:
+                    handler.error(501)
+            except Exception, e:
+                handler.handle_exception(e, self.debug)
+        else:
+            response.set_status(404)
+            
+        response.wsgi_write(start_response)
+        return [""]
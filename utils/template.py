@@ -20,6 +20,13 @@
 Note: This code is slightly altered from google.appengine.ext.webapp.
 Changes by Bill Katz on original:
   - Allow setting of template directory hierarchy in render() and load()
+Later changes:
+  - Compiled templates are cached with the modification times of every file
+    they were built from, and only rebuilt when one of those changes
+  - {% extends %} is resolved once, when a template is compiled, instead of
+    re-reading and re-parsing the parent template on every render
+  - Templates are read by a Loader object per template directory instead of
+    setting Django's global TEMPLATE_DIRS
 
 The main purpose of this module is to hide all of the package import pain
 you normally have to go through to get Django to work. We expose the Django
@@ -28,15 +35,16 @@ on behalf of clients.
 
 Typical usage:
 
-   from google.appengine.ext.webapp import template
+   from utils import template
    print template.render('templates/index.html', {'foo': 'bar'})
 
 Django uses a global setting for the directory in which it looks for templates.
 This is not natural in the context of the webapp module, so our load method
-takes in a complete template path, and we set these settings on the fly
-automatically.  Because we have to set and use a global setting on every
-method call, this module is not thread safe, though that is not an issue
-for applications.
+takes in a complete template path, and templates are read through a Loader
+object for that path's directory instead. No global setting changes when
+templates are loaded or rendered, so this module is thread safe, except for
+{{ block.super }}, which Django implements by keeping the context on the
+block while it renders.
 
 Django template documentation is available at:
 http://www.djangoproject.com/documentation/templates/
@@ -45,6 +53,15 @@ http://www.djangoproject.com/documentation/templates/
 
 import logging
 import os
+import threading
+
+# Django is loaded by the first page rendered, not by every request
+try:
+  from google.appengine.dist import use_library
+  use_library('django', '1.1')
+except ImportError:
+  # Outside of App Engine, e.g. benchmarks/, Django comes from the path
+  pass
 
 try:
   from django import v0_96
@@ -58,17 +75,19 @@ try:
     DEBUG=False,
     TEMPLATE_DEBUG=False,
     TEMPLATE_LOADERS=(
-      'django.template.loaders.filesystem.load_template_source',
+      'utils.template.load_template_source',
     ),
   )
 except (EnvironmentError, RuntimeError):
   pass
 import django.template
 import django.template.loader
+import django.template.defaulttags
+from django.template.loader_tags import BlockNode, ExtendsNode
 
-from google.appengine.ext import webapp
 
-def render(template_path, template_dict, debug=False, template_dirs=()):
+def render(template_path, template_dict, debug=False, template_dirs=(),
+           check_mtime=True):
   """Renders the template at the given path with the given dict of values.
 
   Example usage:
@@ -77,60 +96,182 @@ def render(template_path, template_dict, debug=False, template_dirs=()):
   Args:
     template_path: path to a Django template
     template_dict: dictionary of values to apply to the template
+    check_mtime: whether to rebuild cached templates whose files changed
   """
-  t = load(template_path, debug, template_dirs)
+  t = load(template_path, debug, template_dirs, check_mtime)
   return t.render(Context(template_dict))
 
 
-template_cache = {}
-def load(path, debug=False, template_dirs=()):
-  """Loads the Django template from the given path.
+class Loader(object):
+  """Loads and caches the templates found in a list of directories.
 
-  It is better to use this function than to construct a Template using the
-  class below because Django requires you to load the template with a method
-  if you want imports and extends to work in the template.
+  Each list of directories gets its own Loader, see get_loader(), so
+  templates with the same name in different directories (base.html in
+  views/default and views/default/basic) never get mixed up, and nothing
+  depends on Django's global TEMPLATE_DIRS setting.
   """
-  abspath = os.path.abspath(path)
 
-  if not debug:
-    template = template_cache.get(abspath, None)
-  else:
-    template = None
-
-  if not template:
-    directory, file_name = os.path.split(abspath)
-    if directory:
-      template_dirs = [directory] + template_dirs
-    new_settings = {
-        'TEMPLATE_DIRS': template_dirs,
-        'TEMPLATE_DEBUG': debug,
-        'DEBUG': debug,
-    }
-    old_settings = _swap_settings(new_settings)
+  def __init__(self, template_dirs):
+    self.template_dirs = tuple(template_dirs)
+    # Compiled templates by name, each with the modification times of the
+    # files it was built from
+    self.templates = {}
+
+  def load(self, template_name, debug=False, check_mtime=True):
+    """Returns the compiled template with the given name.
+
+    Templates are compiled once and cached. With check_mtime, a cached
+    template is rebuilt when any of the files it includes or extends has
+    changed; without it, templates are never reloaded, which is what we want
+    in production where files can't change.
+    """
+    if not debug:
+      cached = self.templates.get(template_name, None)
+      if cached and (not check_mtime or _unchanged(cached[1])):
+        return cached[0]
+
+    # Django reads the templates named by {% include %} through the global
+    # loader, load_template_source, which finds this loader here
+    previous = getattr(_local, 'compiling', None)
+    _local.compiling = (self, {})
     try:
-      template = django.template.loader.get_template(file_name)
+      template = _compile(template_name)
+      sources = _local.compiling[1]
     finally:
-      _swap_settings(old_settings)
+      _local.compiling = previous
 
     if not debug:
-      template_cache[abspath] = template
+      self.templates[template_name] = (template, sources)
+
+    return template
 
-    def wrap_render(context, orig_render=template.render):
-      URLNode = django.template.defaulttags.URLNode
-      save_urlnode_render = URLNode.render
-      old_settings = _swap_settings(new_settings)
+  def load_template_source(self, template_name):
+    """Returns the source of the named template and its path, recording its
+    modification time for the template being compiled."""
+    for directory in self.template_dirs:
+      path = os.path.join(directory, template_name)
       try:
-        URLNode.render = _urlnode_render_replacement
-        return orig_render(context)
-      finally:
-        _swap_settings(old_settings)
-        URLNode.render = save_urlnode_render
+        mtime = os.path.getmtime(path)
+        f = open(path)
+        try:
+          source = f.read()
+        finally:
+          f.close()
+      except (IOError, OSError):
+        continue
+      compiling = getattr(_local, 'compiling', None)
+      if compiling and compiling[0] is self:
+        compiling[1][path] = mtime
+      return (source.decode(django.conf.settings.FILE_CHARSET), path)
+    raise django.template.TemplateDoesNotExist(template_name)
+
+
+# Loaders by tuple of template directories
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+# The loader compiling a template in this thread, and the files it read
+_local = threading.local()
+
+def get_loader(template_dirs):
+  """Returns the Loader for the given template directories"""
+  template_dirs = tuple(template_dirs)
+  loader = _loaders.get(template_dirs, None)
+  if loader is None:
+    _loaders_lock.acquire()
+    try:
+      loader = _loaders.setdefault(template_dirs, Loader(template_dirs))
+    finally:
+      _loaders_lock.release()
+  return loader
 
-    template.render = wrap_render
 
+def load(path, debug=False, template_dirs=(), check_mtime=True):
+  """Loads the Django template from the given path.
+
+  It is better to use this function than to construct a Template using the
+  class below because Django requires you to load the template with a method
+  if you want imports and extends to work in the template.
+
+  The template's own directory is searched first for the templates it
+  includes or extends, then template_dirs. See Loader.load for caching.
+  """
+  abspath = os.path.abspath(path)
+  directory, file_name = os.path.split(abspath)
+  loader = get_loader([directory] + list(template_dirs))
+  return loader.load(file_name, debug, check_mtime)
+
+
+def _compile(template_name):
+  """Parses a template and resolves its {% extends %} tag.
+
+  The blocks of the template are merged, as Django's ExtendsNode.render
+  would, into a freshly parsed copy of its parent, and the result becomes
+  the template's node list. Rendering it then reads and parses nothing, and
+  changes nothing in the compiled template, so it can be rendered by 
+  several threads at once. Each template gets its own copy of its parents 
+  since merging modifies them.
+  """
+  source, origin = django.template.loader.find_template_source(template_name)
+  template = django.template.loader.get_template_from_string(
+      source, origin, template_name)
+
+  extends = None
+  for node in template.nodelist:
+    if not isinstance(node, django.template.TextNode):
+      if isinstance(node, ExtendsNode):
+        extends = node
+      break
+
+  # Parents named by a variable can only be resolved when rendering
+  if extends is None or extends.parent_name_expr:
+    return template
+
+  parent = _compile(extends.parent_name)
+  parent_blocks = dict([(n.name, n) for n in
+                        parent.nodelist.get_nodes_by_type(BlockNode)])
+
+  for block_node in extends.nodelist.get_nodes_by_type(BlockNode):
+    parent_block = parent_blocks.get(block_node.name)
+    if parent_block is not None:
+      # Keep the parent's content around for {{ block.super }}
+      parent_block.parent = BlockNode(parent_block.name,
+                                      parent_block.nodelist,
+                                      parent_block.parent)
+      parent_block.nodelist = block_node.nodelist
+
+  template.nodelist = parent.nodelist
   return template
 
 
+def _unchanged(sources):
+  """Returns whether the files at the given paths still have the given
+  modification times."""
+  try:
+    for path, mtime in sources.iteritems():
+      if os.path.getmtime(path) != mtime:
+        return False
+  except OSError:
+    return False
+  return True
+
+
+def load_template_source(template_name, template_dirs=None):
+  """Django template loader.
+
+  While a Loader compiles a template in this thread, templates are read
+  through that Loader. Otherwise they are looked up in template_dirs, or
+  Django's TEMPLATE_DIRS setting.
+  """
+  compiling = getattr(_local, 'compiling', None)
+  if compiling and not template_dirs:
+    return compiling[0].load_template_source(template_name)
+  if not template_dirs:
+    template_dirs = django.conf.settings.TEMPLATE_DIRS
+  return get_loader(template_dirs).load_template_source(template_name)
+load_template_source.is_usable = True
+
+
 def _swap_settings(new):
   """Swap in selected Django settings, returning old settings.
 
@@ -213,6 +354,8 @@ def _urlnode_render_replacement(self, context):
   {% url MyPageHandler "calendar" %}
   {% url MyPageHandler "jsmith","calendar" %}
   """
+  from google.appengine.ext import webapp
+
   args = [arg.resolve(context) for arg in self.args]
   try:
     app = webapp.WSGIApplication.active_instance
@@ -220,3 +363,7 @@ def _urlnode_render_replacement(self, context):
     return handler.get_url(implicit_args=True, *args)
   except webapp.NoUrlFoundError:
     return ''
+
+
+# {% url %} resolves through the webapp url mapping
+django.template.defaulttags.URLNode.render = _urlnode_render_replacement
@@ -0,0 +1,95 @@
+# Copyright (c) 2010 Twilio Inc.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Change versions
+
+A change version is a number kept in memcache under a name, moved forward
+whenever the data it covers is written. Anything derived from that data
+(HTTP validators, cached responses, in-process caches) can be checked
+against the versions it depends on instead of being invalidated entry by
+entry.
+
+Versions are timestamps in microseconds that only move forward, so they
+double as modification times. A version that falls out of memcache is
+recreated from the clock, which is never mistaken for an older value.
+
+Typical usage:
+
+    versions.bump(versions.GLOBAL, versions.service("example"))
+    current = versions.get_multi([versions.GLOBAL])
+"""
+
+import logging
+import time
+
+from google.appengine.api import memcache
+
+# Any write to services, events or statuses
+GLOBAL = "global"
+# Any write to a status
+STATUSES = "statuses"
+
+KEY_PREFIX = "version:"
+
+def service(slug):
+    "Returns the version name covering a service and its events"
+    return "service:" + slug
+    
+def day(d):
+    "Returns a version name which starts when the given day does"
+    return "day:" + d.isoformat()
+
+def now():
+    return int(time.time() * 1000000)
+
+def get(name):
+    "Returns the current version for name"
+    return get_multi([name])[name]
+
+def get_multi(names):
+    "Returns a dict mapping each of the given names to its current version"
+    found = memcache.get_multi(names, key_prefix=KEY_PREFIX)
+    
+    missing = {}
+    for name in names:
+        if found.get(name) is None:
+            missing[name] = now()
+            
+    if missing:
+        # Another request may have created some of them in the meantime
+        not_added = memcache.add_multi(missing, key_prefix=KEY_PREFIX)
+        found.update(missing)
+        if not_added:
+            found.update(memcache.get_multi(not_added, key_prefix=KEY_PREFIX))
+            
+    return found
+    
+def bump(*names):
+    "Moves the given versions forward"
+    found = memcache.get_multi(names, key_prefix=KEY_PREFIX)
+    stamp = now()
+    
+    changed = {}
+    for name in names:
+        changed[name] = max(stamp, found.get(name, 0) + 1)
+        
+    if memcache.set_multi(changed, key_prefix=KEY_PREFIX):
+        logging.error("Memcache set failed for versions %s", names)